@@ -2,52 +2,35 @@ import os
 
 from flask import Flask
 
-from chatbot import bot
+# which routes this process serves:
+# 'webhook' for /callback, 'dashboard' for the configuration website, 'all' for both
+roles = ('all', 'webhook', 'dashboard')
 
-from frontend import dashboard
-from frontend import login
 
-app = Flask(__name__, template_folder='./frontend/templates',
-            static_folder='./frontend/static')
+def create_app(role=None):
+    '''
+    create the flask app for a role, only importing what that role needs
 
-app.secret_key = os.environ.get('SECRET_KEY')
+    the role defaults to the APP_ROLE environment variable, or 'all'
+    '''
+    role = role or os.environ.get('APP_ROLE', 'all')
+    assert role in roles, (role + " is not a valid role")
 
+    app = Flask(__name__, template_folder='./frontend/templates',
+                static_folder='./frontend/static')
 
-app.add_url_rule('/', view_func=dashboard.render)
+    app.secret_key = os.environ.get('SECRET_KEY')
 
-# auth
-app.add_url_rule('/login', view_func=login.redirect_login)
-app.add_url_rule('/login/callback', view_func=login.login_callback)
+    if role in ('all', 'webhook'):
+        from chatbot.webhook import blueprint as webhook_blueprint
+        app.register_blueprint(webhook_blueprint)
 
-# bot
-app.add_url_rule('/callback', view_func=bot.callback, methods=['POST'])
+    if role in ('all', 'dashboard'):
+        from frontend.routes import blueprint as dashboard_blueprint
+        app.register_blueprint(dashboard_blueprint)
 
-# users
-app.add_url_rule('/users', view_func=dashboard.render_users, methods=['GET'])
-app.add_url_rule('/users/<display_name>',
-                 view_func=dashboard.toggle_clearance, methods=['POST'])
+    return app
 
-# groups
-app.add_url_rule('/groups', view_func=dashboard.render_groups, methods=['GET'])
-app.add_url_rule('/groups/<group_id>',
-                 view_func=dashboard.change_group_clearance, methods=['POST'])
-
-# commands
-app.add_url_rule(
-    '/commands', view_func=dashboard.commands_render, methods=['GET'])
-app.add_url_rule(
-    '/commands', view_func=dashboard.create_new_command, methods=['POST'])
-app.add_url_rule(
-    '/commands/new', view_func=dashboard.render_add_new, methods=['GET'])
-app.add_url_rule('/commands/<command_name>',
-                 view_func=dashboard.edit_command, methods=['GET'])
-app.add_url_rule('/commands/<command_name>',
-                 view_func=dashboard.update_command, methods=['POST'])
-
-# do change this one later! ---
-app.add_url_rule('/commands/delete/<command_name>',
-                 view_func=dashboard.delete_command)
-# -----
 
 if __name__ == "__main__":
-    app.run(use_reloader=False)
+    create_app().run(use_reloader=False)
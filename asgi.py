@@ -0,0 +1,96 @@
+import os
+
+import asyncpg
+from asgiref.wsgi import WsgiToAsgi
+from linebot.webhook import SignatureValidator
+
+from app import create_app
+from chatbot.queue_service import split_events
+
+database_url = os.environ.get('DATABASE_URL')
+channel_secret = os.environ.get('CHANNEL_SECRET')
+role = os.environ.get('APP_ROLE', 'all')
+
+signature_validator = SignatureValidator(channel_secret)
+
+# the dashboard and login pages keep running on flask
+if role in ('all', 'dashboard'):
+    dashboard = WsgiToAsgi(create_app('dashboard'))
+else:
+    dashboard = None
+
+pool = None
+
+
+async def read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def respond(send, status, text):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8')],
+    })
+    await send({'type': 'http.response.body', 'body': text.encode('utf-8')})
+
+
+async def callback(scope, receive, send):
+    '''
+    async counterpart of chatbot.bot.callback
+
+    verifies the signature and queues the events without blocking
+    on the database, worker.py handles them afterwards.
+    '''
+    headers = dict(scope['headers'])
+    signature = headers.get(b'x-line-signature', b'').decode('utf-8')
+    body = (await read_body(receive)).decode('utf-8')
+
+    if not signature_validator.validate(body, signature):
+        print("Invalid signature. Please check your channel access token/channel secret.")
+        return await respond(send, 400, 'Bad Request')
+
+    rows = split_events(body)
+    if rows:
+        try:
+            await pool.executemany(
+                "INSERT INTO webhook_events (destination, source_id, payload) VALUES ($1, $2, $3)", rows)
+        except (OSError, asyncpg.PostgresError) as e:
+            print("Failed to queue events: {}".format(e))
+            return await respond(send, 500, 'Internal Server Error')
+
+    await respond(send, 200, 'OK')
+
+
+async def lifespan(receive, send):
+    global pool
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if role in ('all', 'webhook'):
+                pool = await asyncpg.create_pool(database_url)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if pool is not None:
+                await pool.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/callback' and scope['method'] == 'POST' \
+            and role in ('all', 'webhook'):
+        await callback(scope, receive, send)
+    elif dashboard is not None:
+        await dashboard(scope, receive, send)
+    else:
+        await respond(send, 404, 'Not Found')
@@ -0,0 +1,85 @@
+'''
+Compare concurrent webhook throughput of the sync (gunicorn + flask) and
+async (uvicorn + asgi.py) callback entry points.
+
+Start both servers against the same database first, e.g.
+
+    gunicorn 'app:create_app("webhook")' --workers 1 --bind 127.0.0.1:8000
+    uvicorn asgi:app --workers 1 --port 8001
+
+then run
+
+    CHANNEL_SECRET=... python benchmarks/callback_throughput.py \
+        http://127.0.0.1:8000/callback http://127.0.0.1:8001/callback
+'''
+import os
+import sys
+import json
+import hmac
+import time
+import base64
+import hashlib
+import argparse
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def create_body(i):
+    event = {
+        'type': 'message',
+        'mode': 'active',
+        'timestamp': int(time.time() * 1000),
+        'source': {'type': 'user', 'userId': 'Ubenchmark{}'.format(i % 50)},
+        'replyToken': 'benchmark{}'.format(i),
+        'message': {'id': str(i), 'type': 'text', 'text': '?Help'},
+    }
+    return json.dumps({'destination': 'Ubenchmark', 'events': [event]})
+
+
+def sign(body, channel_secret):
+    return base64.b64encode(hmac.new(
+        channel_secret.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).digest()).decode('utf-8')
+
+
+def run(url, requests_count, concurrency, channel_secret):
+    bodies = [create_body(i) for i in range(requests_count)]
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def post(body):
+        start = time.perf_counter()
+        response = session.post(url, data=body.encode('utf-8'), headers={
+            'Content-Type': 'application/json',
+            'X-Line-Signature': sign(body, channel_secret),
+        })
+        return response.status_code, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(post, bodies))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for _, latency in results)
+    errors = sum(1 for status, _ in results if status != 200)
+
+    print("{}: {:.1f} req/s, p50 {:.1f} ms, p95 {:.1f} ms, {} errors".format(
+        url, requests_count / elapsed,
+        latencies[len(latencies) // 2] * 1000,
+        latencies[int(len(latencies) * 0.95)] * 1000, errors))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('urls', nargs='+')
+    arg_parser.add_argument('-n', '--requests', type=int, default=500)
+    arg_parser.add_argument('-c', '--concurrency', type=int, default=50)
+    args = arg_parser.parse_args()
+
+    channel_secret = os.environ.get('CHANNEL_SECRET')
+    if not channel_secret:
+        sys.exit("CHANNEL_SECRET is required to sign the requests")
+
+    for url in args.urls:
+        run(url, args.requests, args.concurrency, channel_secret)
@@ -0,0 +1,93 @@
+'''
+Compare the targeted cinema page parsers with the full-page parsing they
+replaced, on the synthetic pages in benchmarks/fixtures.
+
+The legacy parsers are kept below as they were inside get_now_showing.
+Run from the repository root:
+
+    python benchmarks/cinema_parsers.py
+
+The fixtures are not captured from the cinemas' sites. They are written to
+follow the markup the parsers read (the regular screenings tab of
+21cineplex, the schedule list of cgv), padded with navigation, scripts and
+other tabs, so they check that both parsers agree but the timings only
+show the difference on pages shaped like these, not on the real ones.
+'''
+import os
+import sys
+import timeit
+import tracemalloc
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chatbot.movie_service import html_parser, parse_cgv_movies, parse_xxi_movies
+
+fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+# -- legacy parsers --
+
+def legacy_parse_xxi_movies(html):
+    movies_xxi_ciwalk = BeautifulSoup(html, 'html.parser')
+    movies_xxi_ciwalk = movies_xxi_ciwalk.find(
+        class_='tab-pane fade show active panel-reguler').find_all(class_='col-9')
+
+    movies = []
+    for movie in movies_xxi_ciwalk:
+        if (movie.h3.text):
+            schedule_lists = []
+            showing_hours = movie.find_all('a')
+            for hours in showing_hours:
+                schedule_lists.append(hours.text)
+            movies.append((movie.h3.text.upper().strip(), schedule_lists))
+
+    return movies
+
+
+def legacy_parse_cgv_movies(html):
+    movies_cgv = BeautifulSoup(html, 'html.parser')
+    movies_cgv = movies_cgv.find(class_='schedule-lists').ul
+
+    movies = []
+    for i in movies_cgv:
+        if isinstance(i, Tag):
+            sched = i.find(class_='showtime-lists')
+            movies.append((i.div.a.getText().strip().upper(), sched.getText().split()))
+
+    return movies
+
+
+cases = [
+    ('Ciwalk XXI', 'synthetic_xxi_ciwalk.html', legacy_parse_xxi_movies, parse_xxi_movies),
+    ('CGV BEC', 'synthetic_cgv_bec.html', legacy_parse_cgv_movies, parse_cgv_movies),
+    ('CGV PVJ', 'synthetic_cgv_pvj.html', legacy_parse_cgv_movies, parse_cgv_movies),
+]
+
+
+def measure_peak_memory(parse, html):
+    tracemalloc.start()
+    parse(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+if __name__ == "__main__":
+    print("targeted parsers use {}".format(html_parser))
+
+    for name, fixture, legacy, targeted in cases:
+        with open(os.path.join(fixtures, fixture), encoding='utf-8') as f:
+            html = f.read()
+
+        # both must find the same movies
+        assert legacy(html) == targeted(html), name
+
+        for label, parse in (('legacy', legacy), ('targeted', targeted)):
+            runs = 20
+            seconds = timeit.timeit(lambda: parse(html), number=runs) / runs
+            peak = measure_peak_memory(parse, html)
+            print("{:<11} {:<9} {:8.2f} ms  peak {:8.1f} KiB  {:3d} movies from {:6d} bytes".format(
+                name, label, seconds * 1000, peak / 1024, len(parse(html)), len(html.encode('utf-8'))))
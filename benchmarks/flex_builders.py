@@ -0,0 +1,454 @@
+'''
+Compare the template-based flex builders with the dict-based builders they
+replaced, from the builder call to the json that is sent to LINE.
+
+The legacy builders are kept below as they were, and their output goes
+through FlexSendMessage like it used to. Run from the repository root:
+
+    python benchmarks/flex_builders.py
+'''
+import os
+import sys
+import json
+import timeit
+import tracemalloc
+
+from datetime import datetime, timedelta
+from dateutil import parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from linebot.models import FlexSendMessage
+
+from chatbot.calendar_service import create_date_string, create_event_line
+from chatbot.flex_templates import create_flex_message, create_vertical_bubble
+from chatbot.movie_service import (
+    create_now_showing_carousel, create_upcoming_movies_carousel
+)
+
+
+# -- legacy builders --
+
+def legacy_create_event_line(event):
+    '''
+    '''
+
+    if event:
+
+        start = event['start'].get('dateTime', event['start'].get('date'))
+        event_start_date = parser.parse(start)
+
+        event_summary = event['summary']
+
+        # some string formatting
+        d = create_date_string(event_start_date)
+
+        # set different color for indicating urgency / the event is coming
+        line_color = "#AAAAAA"
+        if "Today" in d:
+            line_color = "#DD3333"
+        elif "Tomorrow" in d:
+            line_color = "#6486E3"
+
+        e = {
+            "type": "box",
+            "layout": "horizontal",
+            "spacing": "sm",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": d,
+                    "wrap": True,
+                    "color": "#999999",
+                    "gravity": "center",
+                    "size": "xxs",
+                    "flex": 22
+                },
+                {
+                    "type": "box",
+                    "layout": "vertical",
+                    "contents": [
+                        {
+                            "type": "box",
+                            "layout": "horizontal",
+                            "contents": [
+                                {
+                                    "type": "filler"
+                                },
+                                {
+                                    "type": "box",
+                                    "layout": "vertical",
+                                    "contents": [
+                                        {
+                                            "type": "filler"
+                                        }
+                                    ],
+                                    "width": "2px",
+                                    "backgroundColor": line_color
+                                },
+                                {
+                                    "type": "filler"
+                                }
+                            ],
+                            "flex": 8
+                        }
+                    ],
+                    "width": "6px"
+                },
+                {
+                    "type": "text",
+                    "text": event_summary.replace(" - ", "\n"),
+                    "wrap": True,
+                    "gravity": "center",
+                    "size": "sm",
+                    "color": "#444444",
+                    "flex": 70
+                }
+            ]
+        }
+
+    else:
+        e = {
+            "type": "box",
+            "layout": "baseline",
+            "spacing": "sm",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": "Tidak ada proker seminggu kedepan",
+                    "wrap": True,
+                    "size": "sm",
+                    "color": "#444444"
+                }
+            ]
+        }
+    return e
+
+
+
+def legacy_create_now_showing_carousel(movies):
+
+    # initiate variables
+    counter = 0
+    bubbles = []
+    three_movies_section = []
+    three_movies_section.append({
+        "type": "text",
+        "text": datetime.now().strftime('NOW SHOWING\n (%a, %d %b)'),
+        "weight": "bold",
+        "wrap": True,
+        "size": "sm",
+        "align": "center"
+    })
+
+    length = len(movies)
+    length_counter = 0
+
+    for movie in movies:
+
+        length_counter = length_counter + 1
+        contents = []
+
+        val_cgv_pvj = movie.get('CGV PVJ')
+        val_cgv_bec = movie.get('CGV BEC')
+        val_ciwalk_xxi = movie.get('Ciwalk XXI')
+
+        if val_cgv_pvj:
+            content = []
+            content.append({
+                "type": "text",
+                "text": "CGV PVJ",
+                "wrap": True,
+                "gravity": "center",
+                "size": "sm",
+                "color": "#444444",
+                "flex": 2
+            })
+            content.append({
+                "type": "text",
+                "wrap": True,
+                "gravity": "center",
+                "text": ' '.join(val_cgv_pvj),
+                "size": "xs",
+                "flex": 4
+            })
+
+            contents.append({
+                "type": "box",
+                "layout": "horizontal",
+                "contents": content
+            })
+
+        if val_cgv_bec:
+            content = []
+            content.append({
+                "type": "text",
+                "text": "CGV BEC",
+                "wrap": True,
+                "gravity": "center",
+                "size": "sm",
+                "color": "#444444",
+                "flex": 2
+            })
+            content.append({
+                "type": "text",
+                "wrap": True,
+                "gravity": "center",
+                "text": ' '.join(val_cgv_bec),
+                "size": "xs",
+                "flex": 4
+            })
+
+            contents.append({
+                "type": "box",
+                "layout": "horizontal",
+                "contents": content
+            })
+
+        if val_ciwalk_xxi:
+            content = []
+            content.append({
+                "type": "text",
+                "text": "Ciwalk XXI",
+                "wrap": True,
+                "gravity": "center",
+                "size": "sm",
+                "color": "#444444",
+                "flex": 2
+            })
+            content.append({
+                "type": "text",
+                "wrap": True,
+                "gravity": "center",
+                "text": ' '.join(val_ciwalk_xxi),
+                "size": "xs",
+                "flex": 4
+            })
+
+            contents.append({
+                "type": "box",
+                "layout": "horizontal",
+                "contents": content
+            })
+
+        # add the movies
+
+        three_movies_section.append({
+            "type": "separator",
+        })
+        three_movies_section.append({
+            "type": "text",
+            "text": movie['title'],
+            'wrap': True,
+            "weight": "bold",
+            "size": "sm"
+        })
+
+        three_movies_section.append({
+            "type": "box",
+            "layout": "vertical",
+            "spacing": "md",
+            "contents": contents
+        })
+
+        # increment counter
+        counter = counter + 1
+
+        # if counter has reached 3
+        if counter == 3:
+            bubbles.append({
+                "type": "bubble",
+                "body": {
+                    "type": "box",
+                    "layout": "vertical",
+                    "spacing": "md",
+                    "contents": three_movies_section
+                },
+            })
+
+            # reset counter
+            counter = 0
+
+            # reset three movies section
+            three_movies_section = []
+            three_movies_section.append({
+                "type": "text",
+                "text": datetime.now().strftime('NOW SHOWING\n (%a, %d %b)'),
+                "weight": "bold",
+                "wrap": True,
+                "size": "sm",
+                "align": "center"
+            })
+        elif length_counter == length:
+            bubbles.append({
+                "type": "bubble",
+                "body": {
+                    "type": "box",
+                    "layout": "vertical",
+                    "spacing": "md",
+                    "contents": three_movies_section
+                },
+            })
+
+    carousel = {
+        "type": "carousel",
+        "contents": bubbles
+    }
+
+    return carousel
+
+
+def legacy_create_upcoming_movies_bubble(movie):
+    contents = []
+    # add title
+    contents.append({
+        "type": "text",
+        "text": movie['title'],
+        "weight": "bold",
+        "size": "sm",
+        "wrap": True
+    })
+
+    contents.append({
+        "type": "text",
+        "text": datetime.strptime(movie['release_date'], '%Y-%m-%d').strftime('%d %b %Y'),
+        "size": "xs"
+    })
+
+    bubble = {
+        "type": "bubble",
+        "hero": {
+                "type": "image",
+                "size": "full",
+                "aspectRatio": "2:3",
+                "aspectMode": "cover",
+                "action": {
+                    "type": "uri",
+                    "label": "Details..",
+                    "uri": "https://www.themoviedb.org/movie/{}".format(str(movie['id'])),
+                },
+            "url": "https://image.tmdb.org/t/p/w500{}".format(movie['poster_path'])
+        },
+        "body": {
+            "type": "box",
+            "layout": "horizontal",
+            "contents": [{
+                "type": "box",
+                "layout": "vertical",
+                "flex": 4,
+                "spacing": "sm",
+                "contents": contents
+            }, {
+                "type": "image",
+                "flex": 1,
+                "size": "xxs",
+                "aspectMode": "fit",
+                "url": "https://www.themoviedb.org/assets/2/v4/logos/293x302-powered-by-square-blue-ee05c47ab249273a6f9f1dcafec63daba386ca30544567629deb1809395d8516.png"
+            }]
+        }
+    }
+
+    return bubble
+
+
+def legacy_create_upcoming_movies_carousel(movies):
+    bubbles = []
+
+    # create a counter to make sure it does not exceed 10 bubbles
+    counter = 0
+    for movie in movies:
+        if counter < 10:
+            bubbles.append(legacy_create_upcoming_movies_bubble(movie))
+        else:
+            break
+        counter = counter + 1
+
+    carousel = {
+        "type": "carousel",
+        "contents": bubbles
+    }
+
+    return carousel
+
+
+
+def legacy_create_agenda(events):
+    content = [{
+        "type": "text",
+        "text": "Agenda LFM",
+        "weight": "bold",
+        "size": "sm"
+    }]
+    for event in events:
+        content.append(legacy_create_event_line(event))
+
+    return {
+        "type": "bubble",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "spacing": "md",
+            "contents": content
+        },
+    }
+
+
+def create_agenda(events):
+    content = ['{"type":"text","text":"Agenda LFM","weight":"bold","size":"sm"}']
+    for event in events:
+        content.append(create_event_line(event))
+
+    return create_vertical_bubble(content)
+
+
+# -- sample data --
+
+now = datetime.now()
+events = [{
+    'start': {'dateTime': (now + timedelta(days=i, hours=i)).isoformat()},
+    'summary': 'Rapat Kru {} - Sekre LFM'.format(i),
+} for i in range(15)]
+
+movies = [{
+    'title': 'MOVIE NUMBER {}'.format(i),
+    'CGV PVJ': ['12:00', '14:30', '17:00', '19:30'],
+    'CGV BEC': ['13:15', '15:45', '18:15'] if i % 2 else None,
+    'Ciwalk XXI': ['12:30', '15:00', '17:30', '20:00', '22:30'],
+} for i in range(30)]
+
+upcoming_movies = [{
+    'id': 1000 + i,
+    'title': 'Upcoming Movie {}'.format(i),
+    'release_date': (now + timedelta(days=i)).strftime('%Y-%m-%d'),
+    'poster_path': '/poster{}.jpg'.format(i),
+} for i in range(20)]
+
+cases = [
+    ('agenda', lambda: FlexSendMessage(alt_text='Agenda', contents=legacy_create_agenda(events)).as_json_string(),
+     lambda: create_flex_message('Agenda', create_agenda(events))),
+    ('now showing', lambda: FlexSendMessage(alt_text='Now Showing', contents=legacy_create_now_showing_carousel(movies)).as_json_string(),
+     lambda: create_flex_message('Now Showing', create_now_showing_carousel(movies))),
+    ('upcoming movies', lambda: FlexSendMessage(alt_text='Upcoming Movies', contents=legacy_create_upcoming_movies_carousel(upcoming_movies)).as_json_string(),
+     lambda: create_flex_message('Upcoming Movies', create_upcoming_movies_carousel(upcoming_movies))),
+]
+
+
+def measure_peak_memory(build):
+    tracemalloc.start()
+    build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+if __name__ == "__main__":
+    for name, legacy, template in cases:
+        # both must describe the same flex message
+        assert json.loads(legacy()) == json.loads(template()), name
+
+        for label, build in (('legacy', legacy), ('template', template)):
+            runs = 200
+            seconds = timeit.timeit(build, number=runs) / runs
+            peak = measure_peak_memory(build)
+            print("{:<16} {:<9} {:8.3f} ms  peak {:7.1f} KiB  {:6d} bytes sent".format(
+                name, label, seconds * 1000, peak / 1024, len(build().encode('utf-8'))))
@@ -0,0 +1,123 @@
+'''
+Run replies through the pooled LINE api client against a local stand-in
+server that rate limits and fails a share of the requests, and compare
+it with the SDK's default client.
+
+    python benchmarks/line_api_client.py --requests 500 --concurrency 8
+
+The stand-in answers 429 with a Retry-After, or 503, at the given rates.
+The default client gives up on those, the pooled client retries them.
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from linebot import LineBotApi  # noqa: E402
+from linebot.exceptions import LineBotApiError  # noqa: E402
+from linebot.models import TextSendMessage  # noqa: E402
+
+from chatbot.line_http_client import (  # noqa: E402
+    PooledHttpClient, connect_timeout, get_line_api_stats, read_timeout
+)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    rate_limited = 0.1
+    unavailable = 0.05
+    latency = 0.005
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.latency)
+
+        roll = random.random()
+        if roll < self.rate_limited:
+            self.respond(429, {'message': 'The API rate limit has been exceeded.'}, {'Retry-After': '0.05'})
+        elif roll < self.rate_limited + self.unavailable:
+            self.respond(503, {'message': 'Service unavailable'})
+        else:
+            self.respond(200, {})
+
+    def respond(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(line_bot_api, requests_count, concurrency):
+    def reply(i):
+        start = time.perf_counter()
+        try:
+            line_bot_api.reply_message('benchmark{}'.format(i), TextSendMessage(text='halo'))
+            ok = True
+        except LineBotApiError:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(reply, range(requests_count)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for _, latency in results)
+    delivered = sum(ok for ok, _ in results)
+    return {
+        'delivered': delivered,
+        'failed': requests_count - delivered,
+        'rps': requests_count / elapsed,
+        'p50': latencies[len(latencies) // 2],
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate-limited', type=float, default=0.1)
+    parser.add_argument('--unavailable', type=float, default=0.05)
+    args = parser.parse_args()
+
+    StandInHandler.rate_limited = args.rate_limited
+    StandInHandler.unavailable = args.unavailable
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = 'http://127.0.0.1:{}'.format(server.server_port)
+
+    for name, line_bot_api in (
+            ('default', LineBotApi('token', endpoint=endpoint)),
+            ('pooled', LineBotApi('token', endpoint=endpoint, timeout=(connect_timeout, read_timeout),
+                                  http_client=PooledHttpClient))):
+        result = run(line_bot_api, args.requests, args.concurrency)
+        print("{:8} {delivered} delivered, {failed} failed, {rps:.1f} req/s, "
+              "p50 {p50:.3f}s, p95 {p95:.3f}s".format(name, **result))
+
+    for endpoint_name, stats in get_line_api_stats().items():
+        print("{}: {calls} calls, {errors} errors, {retries} retried, "
+              "{mean_latency:.3f}s mean / {max_latency:.3f}s max".format(endpoint_name, **stats))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+'''
+Measure cold start: how long importing and creating the app takes and how
+long the first webhook request takes afterwards, each in a fresh interpreter.
+
+Run from the repository root with the usual environment variables set:
+
+    python benchmarks/startup_time.py --runs 5
+
+APP_ROLE selects the role that is measured, see app.create_app.
+'''
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# runs inside a fresh interpreter and prints its timings as json
+probe = r'''
+import json, time, hmac, base64, hashlib, os
+
+start = time.perf_counter()
+from app import create_app
+app = create_app()
+import_time = time.perf_counter() - start
+
+body = json.dumps({'destination': 'Ubenchmark', 'events': []})
+signature = base64.b64encode(hmac.new(
+    os.environ.get('CHANNEL_SECRET', '').encode('utf-8'),
+    body.encode('utf-8'), hashlib.sha256).digest()).decode('utf-8')
+
+client = app.test_client()
+start = time.perf_counter()
+if os.environ.get('APP_ROLE') == 'dashboard':
+    response = client.get('/login')
+else:
+    response = client.post('/callback', data=body, headers={'X-Line-Signature': signature})
+request_time = time.perf_counter() - start
+
+print(json.dumps({'import': import_time, 'first_request': request_time,
+                  'status': response.status_code}))
+'''
+
+
+def measure():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', probe], cwd=root,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--runs', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    os.environ.setdefault('CHANNEL_SECRET', 'benchmark')
+    os.environ.setdefault('CHANNEL_ACCESS_TOKEN', 'benchmark')
+
+    results = [measure() for _ in range(args.runs)]
+
+    for name in ('import', 'first_request'):
+        timings = sorted(result[name] * 1000 for result in results)
+        print("{}: min {:.1f} ms, median {:.1f} ms, max {:.1f} ms".format(
+            name, timings[0], timings[len(timings) // 2], timings[-1]))
+    print("status codes: {}".format(sorted({result['status'] for result in results})))
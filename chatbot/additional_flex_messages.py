@@ -1,35 +1,25 @@
 # to get image from a google drive link use:
 # https://docs.google.com/uc?id=[id]
 
-def create_image_bubble(ratio, url, animated=False):
-    # animated image only supports APNG image (max size: 300KB)
-    bubble = {
-        "type": "bubble",
-        "hero": {
-            "type": "image",
-            "size": "full",
-            "animated": animated,
-            "aspectRatio": ratio,
-            "aspectMode": "cover",
-            "url": url,
-            "action": {
-                "type": "uri",
-                "uri": url
-            }
+from .flex_templates import FlexTemplate, Slot
+
+image_bubble_template = FlexTemplate({
+    "type": "bubble",
+    "hero": {
+        "type": "image",
+        "size": "full",
+        "animated": Slot('animated'),
+        "aspectRatio": Slot('ratio'),
+        "aspectMode": "cover",
+        "url": Slot('url'),
+        "action": {
+            "type": "uri",
+            "uri": Slot('url')
         }
     }
-    return bubble
-
-
-def create_image_carousel(ratio, urls):
-    content = []
+})
 
-    for url in urls:
-        content.append(create_image_bubble(ratio, url))
 
-    carousel = {
-        "type": "carousel",
-        "contents": content
-    }
-
-    return carousel
+def create_image_bubble(ratio, url, animated=False):
+    # animated image only supports APNG image (max size: 300KB)
+    return image_bubble_template.render(ratio=ratio, url=url, animated=animated)
@@ -1,7 +1,10 @@
 import os
 import json
+import hmac
+import base64
+import hashlib
 
-from flask import request, abort
+from urllib.parse import parse_qsl
 
 from linebot import (
     LineBotApi, WebhookHandler
@@ -9,26 +12,33 @@ from linebot import (
 
 from linebot.models import (
     MessageEvent, FollowEvent, UnfollowEvent, JoinEvent, PostbackEvent,
-    TextMessage, TextSendMessage, FlexSendMessage, StickerSendMessage,
+    TextMessage, TextSendMessage, StickerSendMessage,
     SourceRoom, SourceGroup, QuickReply, QuickReplyButton, MessageAction
 )
 
-from linebot.exceptions import (
-    InvalidSignatureError, LineBotApiError
-)
+from linebot.exceptions import LineBotApiError
 
-from .additional_flex_messages import create_image_bubble, create_image_carousel
 from .calendar_service import create_fungs_agenda, create_lfm_agenda
+from .flex_templates import join
+from .line_http_client import PooledHttpClient, connect_timeout, line_api_endpoint, read_timeout
+from .pagination import drop_pages, get_page, paginate, store_pages
+from .payload_budget import budget_flex, budget_reply, split_rows
 
 from .database_service import (
     authenticate, add_follower, add_group,
-    get_code, get_command, get_command_description,
-    remove_follower, track_api_calls, update_code, get_ordered_commands_by_frequency
+    remove_follower, get_ordered_commands_by_frequency
+)
+from .registry_service import (
+    get_code, get_command, get_command_description, get_command_payload,
+    resolve_command, update_code
 )
+from .refresh_service import on_refresh
+from .usage_service import track_api_calls
+from .film_index import find_film
 from .movie_service import (
-    create_upcoming_movies_carousel, discover_movies,
-    create_now_showing_carousel, get_now_showing
+    create_film_bubble, create_upcoming_movies_bubbles, create_now_showing_bubbles, get_now_showing
 )
+from .tmdb_client import discover_movies
 
 from .utils import parse_upcoming_movies_params, translate_date_to_words, translate_words_to_date, compose_help_message
 
@@ -37,29 +47,104 @@ from .utils import parse_upcoming_movies_params, translate_date_to_words, transl
 channel_access_token = os.environ.get('CHANNEL_ACCESS_TOKEN')
 channel_secret = os.environ.get('CHANNEL_SECRET')
 
-line_bot_api = LineBotApi(channel_access_token)
 handler = WebhookHandler(channel_secret)
 
+# created on first use by get_line_bot_api
+_line_bot_api = None
+
 lfm_muda_beo_id = os.environ.get('ID_LFM_MUDA_BEO')
 
+# cache name -> start of the keys of the pages rendered from it
+page_prefixes = {
+    'now_showing': 'nowshowing',
+    'tmdb_week': 'upcomingmovies:',
+    'lfm_agenda': 'agenda:lfm:',
+    'fungs_agenda': 'agenda:fungs:',
+}
 
-def callback():
-    # get X-Line-Signature header value
-    signature = request.headers['X-Line-Signature']
 
-    # get request body as text
-    body = request.get_data(as_text=True)
-    print(body)
-    # app.logger.info("Request body: " + body)
+def get_line_bot_api():
+    '''
+    get the messaging api client, creating it on first use
+    '''
+    global _line_bot_api
 
-    # handle webhook body
-    try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
-        print("Invalid signature. Please check your channel access token/channel secret.")
-        abort(400)
+    if _line_bot_api is None:
+        # LineBotApi always hands its own timeout to the client, so it is passed here
+        _line_bot_api = LineBotApi(
+            channel_access_token, endpoint=line_api_endpoint,
+            timeout=(connect_timeout, read_timeout), http_client=PooledHttpClient)
+
+    return _line_bot_api
+
+
+def reply_payload(reply_token, payload):
+    '''
+    reply with a serialized list of messages, e.g. a static command's payload
+
+    skips the SDK's message models, which would only parse
+    the json back into objects to serialize it again.
+    '''
+    body = '{"replyToken":' + json.dumps(reply_token) + \
+        ',"messages":' + payload + '}'
+
+    # _post is what reply_message sends through, including its error handling
+    get_line_bot_api()._post('/v2/bot/message/reply', data=body.encode('utf-8'))
+
+
+def reply_json(reply_token, messages):
+    '''
+    reply with messages that are already serialized to json,
+    e.g. flex messages from payload_budget.budget_flex
+
+    replies with too many messages are cut down by budget_reply
+    '''
+    reply_payload(reply_token, join(budget_reply(messages)))
+
+
+def reply_pages(event, query_key, alt_text, create_bubbles, ttl, clearance=1, as_carousel=True):
+    '''
+    reply with the first page of a long reply, the rest are sent
+    by handle_postback when the "next page" button is pressed
+
+    every page is rendered once from create_bubbles and saved for ttl seconds,
+    so asking again or turning pages never fetches the data again
+    '''
+    page = get_page(query_key, 1)
+
+    if page:
+        payload = page[0]
+    else:
+        pages = paginate(query_key, alt_text, create_bubbles(), as_carousel)
+        store_pages(query_key, pages, ttl, clearance)
+        payload = pages[0]
+
+    reply_payload(event.reply_token, payload)
+
+
+def drop_refreshed_pages(name, args):
+    '''
+    pages are rendered again from the rebuilt cache the next time they are asked for
+    '''
+    if name in page_prefixes:
+        drop_pages(page_prefixes[name])
 
-    return 'OK'
+
+on_refresh(drop_refreshed_pages)
+
+
+def dispatch_event(event, destination=None):
+    '''
+    run a single queued event through the webhook handlers
+
+    the handler only accepts signed bodies, so the rebuilt body is signed
+    again with the channel secret before being handed over
+    '''
+    body = json.dumps({'destination': destination, 'events': [event]})
+    signature = base64.b64encode(hmac.new(
+        channel_secret.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).digest()).decode('utf-8')
+
+    handler.handle(body, signature)
 
 
 def execute_command(event, text_string):
@@ -77,12 +162,27 @@ def execute_command(event, text_string):
     else:  # temporary fix
         other_string = []
 
-    # get the command from database
-    command_tuple = get_command(command_string)
-    # if the command exists in the database, it should be truthy
+    # resolve aliases and typos, unknown commands never reach the database
+    command_name, suggestion = resolve_command(command_string)
+
+    # suggest the closest command if the user may use it
+    if suggestion:
+        suggestion_tuple = get_command(suggestion)
+        if suggestion_tuple and authenticate(event.source, suggestion_tuple[2]):
+            get_line_bot_api().reply_message(event.reply_token, TextSendMessage(
+                text="Maksudnya ?{}?".format(suggestion),
+                quick_reply=QuickReply(items=[QuickReplyButton(action=MessageAction(
+                    label=("?" + suggestion)[:20], text="?" + suggestion))])))
+        return
+
+    command_string = command_name
+
+    # get the command from the registry
+    command_tuple = get_command(command_string) if command_string else None
+    # if the command exists in the registry, it should be truthy
     if command_tuple:
         # unpack the tuple
-        c_type, c_content, c_clearance = get_command(command_string)
+        c_type, c_content, c_clearance = command_tuple
 
         # check if the user has clearance for the command
         if authenticate(event.source, c_clearance):
@@ -90,23 +190,16 @@ def execute_command(event, text_string):
             # collect data
             track_api_calls(command_string, event.source.user_id)
 
-            # for simple text-based replies
-            if c_type == 'text':
-                line_bot_api.reply_message(
-                    event.reply_token, TextSendMessage(text=c_content))
-
-            # for simple image-based replies
-            elif c_type == 'image':
-                # unpack the content first into ratio and image url
-                ratio, image_url, alt_text = json.loads(c_content).values()
-                # then create the content bubble using ratio and image url
-                content = create_image_bubble(ratio, image_url)
-                line_bot_api.reply_message(event.reply_token, FlexSendMessage(
-                    alt_text=alt_text, contents=content))
+            # for simple text and image based replies,
+            # which are already built when the command is saved
+            if c_type in ('text', 'image', 'image carousel'):
+                payload = get_command_payload(command_string)
+                if payload:
+                    reply_payload(event.reply_token, payload)
 
             # for code text-based replies
             elif c_type == 'code':
-                line_bot_api.reply_message(
+                get_line_bot_api().reply_message(
                     event.reply_token, TextSendMessage(text=get_code(c_content)))
 
             # for updating code commands
@@ -117,52 +210,53 @@ def execute_command(event, text_string):
                     else:
                         update_code(c_content, ' '.join(other_string))
 
-                    line_bot_api.reply_message(event.reply_token, TextSendMessage(
+                    get_line_bot_api().reply_message(event.reply_token, TextSendMessage(
                         text=("Kode sudah diganti menjadi " + get_code(c_content))))
                 else:
-                    line_bot_api.reply_message(event.reply_token, TextSendMessage(
+                    get_line_bot_api().reply_message(event.reply_token, TextSendMessage(
                         text=('Mau diganti sama apa kodenya?')))
 
-            elif c_type == 'image carousel':
-                # unpack the content first into ratio and image url
-                ratio, image_urls, alt_text = json.loads(c_content).values()
-
-                # count how many images are in the command
-                images_count = len(image_urls)
-
-                image_urls_sects = []
-                if images_count < 51:
-                    for i in range(5):
-                        image_urls_sect = image_urls[i*10:(i+1)*10]
-                        if image_urls_sect:
-                            image_urls_sects.append(image_urls_sect)
-
-                replies = [FlexSendMessage(contents=create_image_carousel(
-                    ratio, urls_sect), alt_text=alt_text) for urls_sect in image_urls_sects]
-                line_bot_api.reply_message(event.reply_token, replies)
-
             # for complex replies [to do list], not yet added to database
             elif c_type == 'others':
                 if command_string == 'agenda':
                     duration = translate_words_to_date(' '.join(other_string))
                     alt_text = "Agenda " + \
                         translate_date_to_words(int(duration)) + " Kedepan"
+                    # long agendas are split into bubbles, sent a page at a time
                     if authenticate(event.source, 2):
-                        line_bot_api.reply_message(event.reply_token, FlexSendMessage(
-                            alt_text=alt_text, contents=create_fungs_agenda(duration)))
+                        reply_pages(event, 'agenda:fungs:{}'.format(duration), alt_text,
+                                    lambda: split_rows(create_fungs_agenda(duration)),
+                                    ttl=7200, clearance=2, as_carousel=False)
                     else:
-                        line_bot_api.reply_message(event.reply_token, FlexSendMessage(
-                            alt_text=alt_text, contents=create_lfm_agenda(duration)))
+                        reply_pages(event, 'agenda:lfm:{}'.format(duration), alt_text,
+                                    lambda: split_rows(create_lfm_agenda(duration)),
+                                    ttl=600, as_carousel=False)
 
                 elif command_string == 'upcomingmovies':
                     start_date, end_date, region = parse_upcoming_movies_params(
                         other_string)
-                    line_bot_api.reply_message(event.reply_token, FlexSendMessage(alt_text="Upcoming Movies", contents=create_upcoming_movies_carousel(
-                        discover_movies(start_date=start_date, end_date=end_date, region=region))))
+                    reply_pages(event, 'upcomingmovies:{}:{}:{}'.format(region, start_date, end_date),
+                                "Upcoming Movies", lambda: create_upcoming_movies_bubbles(
+                                    discover_movies(start_date=start_date, end_date=end_date, region=region)),
+                                ttl=3600)
 
                 elif command_string == 'nowshowing':
-                    line_bot_api.reply_message(event.reply_token, FlexSendMessage(
-                        alt_text="Now Showing", contents=create_now_showing_carousel(get_now_showing())))
+                    reply_pages(event, 'nowshowing', "Now Showing",
+                                lambda: create_now_showing_bubbles(*get_now_showing()),
+                                ttl=14400)
+
+                elif command_string == 'film':
+                    # only searches what is already cached, it never scrapes
+                    film = find_film(' '.join(other_string)) if other_string else None
+                    if film:
+                        reply_json(event.reply_token, budget_flex(
+                            film['title'], [create_film_bubble(film)], as_carousel=False))
+                    elif other_string:
+                        get_line_bot_api().reply_message(event.reply_token, TextSendMessage(
+                            text="Film {} belum ketemu nih".format(' '.join(other_string))))
+                    else:
+                        get_line_bot_api().reply_message(event.reply_token, TextSendMessage(
+                            text="Mau cari film apa? Contoh: ?Film Dune"))
 
             elif c_type == 'help':
 
@@ -189,7 +283,7 @@ def execute_command(event, text_string):
                 ])
 
                 # send the message
-                line_bot_api.reply_message(
+                get_line_bot_api().reply_message(
                     event.reply_token, TextSendMessage(
                         text=reply, quick_reply=quick_reply_buttons))
 
@@ -208,14 +302,29 @@ def handle_message(event):
         # execute_command(event, text)
 
 
+@ handler.add(PostbackEvent)
+def handle_postback(event):
+    data = dict(parse_qsl(event.postback.data))
+
+    # "next page" buttons, see pagination.paginate
+    if data.get('action') == 'page':
+        page = get_page(data.get('key'), int(data.get('page', 0)))
+
+        if page is None:
+            get_line_bot_api().reply_message(event.reply_token, TextSendMessage(
+                text="Halamannya sudah kedaluwarsa, coba kirim lagi perintahnya ya"))
+        elif authenticate(event.source, page[1]):
+            reply_payload(event.reply_token, page[0])
+
+
 @ handler.add(FollowEvent)
 def handle_follow(event):
     # get profile
-    profile = line_bot_api.get_profile(event.source.user_id)
+    profile = get_line_bot_api().get_profile(event.source.user_id)
 
     # check if user exists in Muda Beo
     try:
-        line_bot_api.get_group_member_profile(
+        get_line_bot_api().get_group_member_profile(
             lfm_muda_beo_id, event.source.user_id)
         user_type = 1
     except LineBotApiError as err:
@@ -250,7 +359,7 @@ def handle_follow(event):
         all_reply = [TextSendMessage(text=welcome_reply)]
 
     # send a welcoming message and onboarding
-    line_bot_api.reply_message(event.reply_token, all_reply)
+    get_line_bot_api().reply_message(event.reply_token, all_reply)
 
 
 @ handler.add(JoinEvent)
@@ -258,12 +367,12 @@ def handle_join(event):
     # get group id
     if isinstance(event.source, SourceGroup):
         reply = "Halo kru! Aku perlu catat nama grupnya dulu nih, tolong kirim ?Register dan nama grupnya. Contoh: ?Register LFM Muda Beo. Terus kalau udah, kabarin ke fungsionarisnya yaa. \nTerimakasih!"
-        line_bot_api.reply_message(event.reply_token, [TextSendMessage(
+        get_line_bot_api().reply_message(event.reply_token, [TextSendMessage(
             reply), StickerSendMessage(package_id='11537', sticker_id='52002739')])
     if isinstance(event.source, SourceRoom):
         reply = "Halo! Maaf belum bisa bantu di multichat nih. Hehe"
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(reply))
-        line_bot_api.leave_room(event.source.room_id)
+        get_line_bot_api().reply_message(event.reply_token, TextSendMessage(reply))
+        get_line_bot_api().leave_room(event.source.room_id)
 
 
 @ handler.add(UnfollowEvent)
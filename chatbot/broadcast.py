@@ -0,0 +1,153 @@
+# pushes the agenda to every registered group and follower,
+# meant to be run by a scheduler, e.g. every monday morning:
+#
+#     python -m chatbot.broadcast [duration]
+#
+# duration is read like ?Agenda's, e.g. 14 or "bulan depan", a week by default
+import os
+import sys
+import json
+import time
+import uuid
+
+from datetime import datetime
+
+import requests
+
+from linebot.exceptions import LineBotApiError
+
+from .bot import get_line_bot_api
+from .calendar_service import create_fungs_agenda, create_lfm_agenda, timezone
+from .database_service import _run_query
+from .pagination import paginate, store_pages
+from .payload_budget import split_rows
+from .rate_limiter import RateLimiter
+from .utils import translate_date_to_words, translate_words_to_date
+
+# the most user ids a multicast accepts
+multicast_limit = 500
+# requests per second, well below the api's own limits
+rate = float(os.environ.get('BROADCAST_RATE', 10))
+# how long the "next page" buttons of a broadcast keep working
+page_ttl = int(os.environ.get('BROADCAST_PAGE_TTL', 86400))
+
+
+def get_recipients():
+    '''
+    get every registered follower and group by clearance
+
+    returns: dict of clearance -> (list of user ids, list of group ids)
+    '''
+    recipients = {1: ([], []), 2: ([], [])}
+
+    success, users = _run_query(
+        "SELECT user_id, user_type FROM followers WHERE user_type >= 1")
+    if success:
+        for user_id, user_type in users:
+            recipients[min(user_type, 2)][0].append(user_id)
+
+    success, groups = _run_query(
+        "SELECT group_id, group_type FROM groups WHERE group_type >= 1")
+    if success:
+        for group_id, group_type in groups:
+            recipients[min(group_type, 2)][1].append(group_id)
+
+    return recipients
+
+
+def render_agenda(clearance, duration):
+    '''
+    render the agenda that recipients with `clearance` get, once for all of them
+
+    the rest of the pages are saved for the "next page" buttons,
+    under a key of their own so ?Agenda keeps its fresher pages
+
+    returns: serialized list of messages
+    '''
+    if clearance >= 2:
+        rows = create_fungs_agenda(duration)
+        name = 'fungs'
+    else:
+        rows = create_lfm_agenda(duration)
+        name = 'lfm'
+
+    alt_text = "Agenda " + translate_date_to_words(int(duration)) + " Kedepan"
+    query_key = 'broadcast:agenda:{}:{}:{}'.format(
+        name, duration, timezone.localize(datetime.now()).date().isoformat())
+
+    pages = paginate(query_key, alt_text, split_rows(rows), as_carousel=False)
+    store_pages(query_key, pages, page_ttl, clearance)
+
+    return pages[0]
+
+
+def send(path, to, payload, limiter):
+    '''
+    push or multicast a serialized list of messages
+
+    the retry key lets the client retry the request without sending it twice
+
+    returns: bool
+    '''
+    body = '{"to":' + json.dumps(to) + ',"messages":' + payload + '}'
+    headers = {'Content-Type': 'application/json',
+               'X-Line-Retry-Key': str(uuid.uuid4())}
+
+    limiter.wait()
+    try:
+        get_line_bot_api()._post(path, data=body.encode('utf-8'), headers=headers)
+    except LineBotApiError as error:
+        # 409 means a retry of a request that was already accepted
+        if error.status_code == 409:
+            return True
+        print("Broadcast to {} failed: {}".format(path, error.error.message))
+        return False
+    except requests.exceptions.RequestException as error:
+        # still failing after the client's retries, the rest are sent anyway
+        print("Broadcast to {} failed: {}".format(path, error))
+        return False
+
+    return True
+
+
+def broadcast_agenda(duration=7):
+    '''
+    send the agenda to every registered follower and group
+
+    followers are sent multicasts of up to multicast_limit users,
+    groups can only be pushed to one at a time
+
+    returns: dict of delivered, failed, requests and elapsed seconds
+    '''
+    limiter = RateLimiter(rate)
+    stats = {'delivered': 0, 'failed': 0, 'requests': 0}
+    start = time.perf_counter()
+
+    for clearance, (users, groups) in get_recipients().items():
+        if not users and not groups:
+            continue
+
+        payload = render_agenda(clearance, duration)
+
+        batches = [('/v2/bot/message/multicast', users[i:i+multicast_limit])
+                   for i in range(0, len(users), multicast_limit)]
+        batches += [('/v2/bot/message/push', group_id) for group_id in groups]
+
+        for path, to in batches:
+            count = len(to) if isinstance(to, list) else 1
+            stats['requests'] += 1
+            if send(path, to, payload, limiter):
+                stats['delivered'] += count
+            else:
+                stats['failed'] += count
+
+    stats['elapsed'] = time.perf_counter() - start
+    return stats
+
+
+if __name__ == '__main__':
+    stats = broadcast_agenda(translate_words_to_date(' '.join(sys.argv[1:])))
+    print("Broadcast: {delivered} delivered, {failed} failed, {requests} requests in {elapsed:.1f}s, "
+          "{throughput:.1f} recipients/s".format(
+              throughput=(stats['delivered'] + stats['failed']) / stats['elapsed'] if stats['elapsed'] else 0,
+              **stats))
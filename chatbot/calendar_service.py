@@ -1,18 +1,15 @@
 import os
 import json
+import threading
 
 from datetime import datetime, timedelta
 from dateutil import parser
 
-import pytz
-
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google.oauth2 import service_account
-from cachetools.func import ttl_cache
+
+from .flex_templates import FlexTemplate, Slot
+from .refresh_service import refreshing_cache
+from .utils import calendar_timezone
 
 # google script calendar api,
 # i think this is needed as timezone is imported to other services.
@@ -24,35 +21,175 @@ calendar_endpoint_token = os.environ.get('CALENDAR_ENDPOINT_TOKEN')
 lfm_calendar_id = os.environ.get('LFM_CALENDAR_ID')
 fungs_calendar_id = os.environ.get('FUNGS_CALENDAR_ID')
 
-# google cloud api
-raw_credentials = os.environ.get('GSERVICE_ACCOUNT_CREDENTIALS')
-json_credentials = json.loads(raw_credentials, strict=False)
-credentials = service_account.Credentials.from_service_account_info(
-    json_credentials)
 
-# need to check best practice whether create once or create when needed and close afterwards.
-service = build('calendar', 'v3', credentials=credentials)
+def parse_calendars(text):
+    '''
+    parse "name=calendar id:clearance,..." into a list of (name, calendar id, clearance)
+    '''
+    calendars = []
+    for item in text.split(','):
+        name, _, rest = item.partition('=')
+        calendar_id, _, clearance = rest.rpartition(':')
+        calendars.append((name.strip(), calendar_id.strip(), int(clearance)))
 
-if calendar_endpoint:
-    timezone = pytz.timezone("UTC")  # set as UTC as heroku runs on UTC
+    return calendars
+
+
+# the calendars shown by ?Agenda, in order, each to users with at least its clearance
+if os.environ.get('AGENDA_CALENDARS'):
+    calendars = parse_calendars(os.environ['AGENDA_CALENDARS'])
 else:
-    # set as Asia/Jakarta on local machine
-    timezone = pytz.timezone("Asia/Jakarta")
+    calendars = [(name, calendar_id, clearance) for name, calendar_id, clearance in (
+        ('Agenda LFM', lfm_calendar_id, 1),
+        ('Agenda Fungs', fungs_calendar_id, 2),
+    ) if calendar_id]
+
+# google cloud api, created on first use by get_service
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    '''
+    get the google calendar api client, building it on first use
+
+    the discovery document is read from the copy shipped with
+    google-api-python-client instead of being fetched from google.
+    '''
+    global _service
+
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                # imported here as the google libraries are slow to import
+                from googleapiclient.discovery import build
+                from google.oauth2 import service_account
+
+                raw_credentials = os.environ.get('GSERVICE_ACCOUNT_CREDENTIALS')
+                json_credentials = json.loads(raw_credentials, strict=False)
+                credentials = service_account.Credentials.from_service_account_info(
+                    json_credentials)
+
+                _service = build('calendar', 'v3', credentials=credentials,
+                                 static_discovery=True, cache_discovery=False)
+
+    return _service
+
+
+# the timezone the calendars are read in, see utils.calendar_timezone
+timezone = calendar_timezone
 
 
 def get_calendar_metadata(calendar_id):
 
     # documentation https://developers.google.com/calendar/v3/reference/calendars
     try:
-        metadata = service.calendars().get(calendarId=calendar_id).execute()
+        metadata = get_service().calendars().get(calendarId=calendar_id).execute()
     except HttpError as err:
         print(err.error_details)
         return None
     return metadata
 
 
+event_line_template = FlexTemplate({
+    "type": "box",
+    "layout": "horizontal",
+    "spacing": "sm",
+    "contents": [
+        {
+            "type": "text",
+            "text": Slot('date'),
+            "wrap": True,
+            "color": "#999999",
+            "gravity": "center",
+            "size": "xxs",
+            "flex": 22
+        },
+        {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {
+                    "type": "box",
+                    "layout": "horizontal",
+                    "contents": [
+                        {
+                            "type": "filler"
+                        },
+                        {
+                            "type": "box",
+                            "layout": "vertical",
+                            "contents": [
+                                {
+                                    "type": "filler"
+                                }
+                            ],
+                            "width": "2px",
+                            "backgroundColor": Slot('line_color')
+                        },
+                        {
+                            "type": "filler"
+                        }
+                    ],
+                    "flex": 8
+                }
+            ],
+            "width": "6px"
+        },
+        {
+            "type": "text",
+            "text": Slot('summary'),
+            "wrap": True,
+            "gravity": "center",
+            "size": "sm",
+            "color": "#444444",
+            "flex": 70
+        }
+    ]
+})
+
+empty_event_line = FlexTemplate({
+    "type": "box",
+    "layout": "baseline",
+    "spacing": "sm",
+    "contents": [
+        {
+            "type": "text",
+            "text": "Tidak ada proker seminggu kedepan",
+            "wrap": True,
+            "size": "sm",
+            "color": "#444444"
+        }
+    ]
+}).render()
+
+agenda_header_template = FlexTemplate({
+    "type": "text",
+    "text": Slot('name'),
+    "weight": "bold",
+    "size": "sm"
+})
+
+# used when the agenda has more than one section
+agenda_section_header_template = FlexTemplate({
+    "type": "text",
+    "text": Slot('name'),
+    "weight": "bold",
+    "align": "center",
+    "size": "sm"
+})
+
+agenda_separator = FlexTemplate({
+    'type': 'separator',
+    'color': '#CCCCCC',
+    'margin': 'lg'
+}).render()
+
+
 def create_event_line(event):
     '''
+    create a serialized agenda row for an event,
+    or a "no events" row if event is None
     '''
 
     if event:
@@ -72,203 +209,111 @@ def create_event_line(event):
         elif "Tomorrow" in d:
             line_color = "#6486E3"
 
-        e = {
-            "type": "box",
-            "layout": "horizontal",
-            "spacing": "sm",
-            "contents": [
-                {
-                    "type": "text",
-                    "text": d,
-                    "wrap": True,
-                    "color": "#999999",
-                    "gravity": "center",
-                    "size": "xxs",
-                    "flex": 22
-                },
-                {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [
-                        {
-                            "type": "box",
-                            "layout": "horizontal",
-                            "contents": [
-                                {
-                                    "type": "filler"
-                                },
-                                {
-                                    "type": "box",
-                                    "layout": "vertical",
-                                    "contents": [
-                                        {
-                                            "type": "filler"
-                                        }
-                                    ],
-                                    "width": "2px",
-                                    "backgroundColor": line_color
-                                },
-                                {
-                                    "type": "filler"
-                                }
-                            ],
-                            "flex": 8
-                        }
-                    ],
-                    "width": "6px"
-                },
-                {
-                    "type": "text",
-                    "text": event_summary.replace(" - ", "\n"),
-                    "wrap": True,
-                    "gravity": "center",
-                    "size": "sm",
-                    "color": "#444444",
-                    "flex": 70
-                }
-            ]
-        }
+        e = event_line_template.render(
+            date=d, line_color=line_color, summary=event_summary.replace(" - ", "\n"))
 
     else:
-        e = {
-            "type": "box",
-            "layout": "baseline",
-            "spacing": "sm",
-            "contents": [
-                {
-                    "type": "text",
-                    "text": "Tidak ada proker seminggu kedepan",
-                    "wrap": True,
-                    "size": "sm",
-                    "color": "#444444"
-                }
-            ]
-        }
+        e = empty_event_line
     return e
 
 
-def request_events(calendar_id, duration):
-
+def request_calendar_events(calendar_ids, duration):
+    '''
+    get the events of every calendar in one batch request to google
 
+    returns: dict of calendar id -> list of events, or None if it failed
+    '''
     now = datetime.utcnow()
     then = (now + timedelta(days=duration))
 
     time_min = now.isoformat() + 'Z'
     time_max = then.isoformat() + 'Z'
 
-    # documentation: https://developers.google.com/calendar/v3/reference/events/list
+    results = {}
 
-    try:
-        events_result = service.events().list(
+    def collect(request_id, response, exception):
+        if exception is not None:
+            print(getattr(exception, 'error_details', exception))
+            results[request_id] = None
+        else:
+            results[request_id] = response.get('items', [])
+
+    service = get_service()
+    batch = service.new_batch_http_request(callback=collect)
+    for calendar_id in calendar_ids:
+        batch.add(service.events().list(
             calendarId=calendar_id,
             timeMin=time_min,
             timeMax=time_max,
             singleEvents=True,
-            orderBy='startTime').execute()
-        events = events_result.get('items', [])
+            orderBy='startTime'), request_id=calendar_id)
+
+    try:
+        batch.execute()
     except HttpError as err:
         print(err.error_details)
-        return None
 
-    return events
+    return {calendar_id: results.get(calendar_id) for calendar_id in calendar_ids}
 
 
-@ttl_cache(maxsize=2, ttl=600)
-def create_lfm_agenda(duration=7):
+def event_start(event):
+    '''
+    the start of an event as an aware datetime, all day events start at midnight
+    '''
+    start = parser.parse(event['start'].get('dateTime', event['start'].get('date')))
+    return start if start.tzinfo else timezone.localize(start)
 
-    # get events
-    events = request_events(lfm_calendar_id, duration)
 
-    # create agenda header
-    header = {
-        "type": "text",
-        "text": "Agenda LFM",
-        "weight": "bold",
-        "size": "sm"
-    }
+def create_agenda(clearance, duration=7):
+    '''
+    create the rows of the agenda bubble for users with `clearance`, header first
 
-    # create content
-    content = []
-    content.append(header)
+    every calendar they may see is a section of its own, in the order of
+    `calendars`, with its events by start time. all of them are fetched
+    in one request.
 
-    # new (using gcp api)
-    if events:
-        for event in events:
-            content.append(create_event_line(event))
-    else:
-        content.append(create_event_line(None))
-    # end of new
+    payload_budget.split_rows turns them into bubbles
+    '''
+    shown = [(name, calendar_id) for name, calendar_id, calendar_clearance in calendars
+             if calendar_clearance <= clearance]
+    events = request_calendar_events(
+        list(dict.fromkeys(calendar_id for _, calendar_id in shown)), duration) if shown else {}
 
-    bubble = {
-        "type": "bubble",
-        "body": {
-            "type": "box",
-            "layout": "vertical",
-            "spacing": "md",
-            "contents": content
-        },
-    }
+    header_template = agenda_section_header_template if len(shown) > 1 else agenda_header_template
 
-    return bubble
+    content = []
+    for name, calendar_id in shown:
+        if content:
+            content.append(agenda_separator)
+        content.append(header_template.render(name=name))
 
+        calendar_events = sorted(events.get(calendar_id) or [], key=event_start)
+        if calendar_events:
+            for event in calendar_events:
+                content.append(create_event_line(event))
+        else:
+            content.append(create_event_line(None))
 
-@ttl_cache(maxsize=2, ttl=7200)
-def create_fungs_agenda(duration=7):
+    if not content:
+        content = [agenda_header_template.render(name="Agenda LFM"), create_event_line(None)]
 
-    # get events
-    events = request_events(lfm_calendar_id, duration)
-    events_fungs = request_events(fungs_calendar_id, duration)
+    return tuple(content)
 
-    # create agenda header
-    header = {
-        "type": "text",
-        "text": "Agenda LFM",
-        "weight": "bold",
-        "align": "center",
-        "size": "sm"
-    }
 
-    # create content
-    content = []
-    content.append(header)
+@refreshing_cache('lfm_agenda', ttl=600, maxsize=2, command='agenda')
+def create_lfm_agenda(duration=7):
+    '''
+    create the rows of the agenda bubble kru get, see create_agenda
+    '''
+    return create_agenda(1, duration)
 
-    # new (using gcp api)
-    if events:
-        for event in events:
-            content.append(create_event_line(event))
-    else:
-        content.append(create_event_line(None))
-
-    # add separator
-    content.append({
-        'type': 'separator',
-        'color': '#CCCCCC',
-        'margin': 'lg'
-    })
-    content.append({
-        "type": "text",
-        "text": "Agenda Fungs",
-        "weight": "bold",
-        "align": "center",
-        "size": "sm"
-    })
-
-    if events_fungs:
-        for event in events:
-            content.append(create_event_line(event))
-    else:
-        content.append(create_event_line(None))
 
-    bubble = {
-        "type": "bubble",
-        "body": {
-            "type": "box",
-            "layout": "vertical",
-            "spacing": "md",
-            "contents": content
-        },
-    }
-    return bubble
+@refreshing_cache('fungs_agenda', ttl=7200, maxsize=2, command='agenda')
+def create_fungs_agenda(duration=7):
+    '''
+    create the rows of the agenda bubble fungs get, see create_agenda
+    '''
+    return create_agenda(2, duration)
 
 
 def create_date_string(date):
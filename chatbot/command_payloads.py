@@ -0,0 +1,75 @@
+import re
+import json
+
+from .additional_flex_messages import create_image_bubble
+from .flex_templates import join, create_text_message
+from .payload_budget import budget_flex, budget_reply, max_messages
+
+# command types whose replies never change, see build_command_payload
+static_command_types = ('text', 'image', 'image carousel')
+
+# LINE's limits, see https://developers.line.biz/en/reference/messaging-api/#message-objects
+max_text_length = 5000
+max_alt_text_length = 400
+images_per_carousel = 10
+
+ratio_pattern = re.compile(r'^\d+(\.\d+)?:\d+(\.\d+)?$')
+
+
+def _validate_image(ratio, url, alt_text):
+    if not ratio_pattern.match(ratio or ''):
+        raise ValueError("Ratio must be written as width:height, e.g. 1:1.5")
+    if not url.startswith('https://'):
+        raise ValueError("Image urls must start with https://")
+    if not 0 < len(alt_text or '') <= max_alt_text_length:
+        raise ValueError("Alt text must be 1 to {} characters long".format(
+            max_alt_text_length))
+
+
+def build_command_payload(command_type, content, validate=True):
+    '''
+    validate a static command and build the messages it replies with
+
+    parameters ->
+    command_type,
+    content,
+    validate
+
+    content is the text for text commands and the json string the dashboard
+    saves for image commands. validate can be turned off for commands that
+    were saved before they were validated.
+
+    returns: the serialized list of messages, ready to be sent as is
+    raises ValueError if the command can't be sent as it is
+    '''
+    if command_type == 'text':
+        if validate and not 0 < len(content or '') <= max_text_length:
+            raise ValueError("Text must be 1 to {} characters long".format(
+                max_text_length))
+        messages = [create_text_message(content)]
+
+    elif command_type == 'image':
+        ratio, image_url, alt_text = json.loads(content).values()
+        if validate:
+            _validate_image(ratio, image_url, alt_text)
+        messages = budget_flex(
+            alt_text, [create_image_bubble(ratio, image_url)], as_carousel=False)
+
+    elif command_type == 'image carousel':
+        ratio, image_urls, alt_text = json.loads(content).values()
+        if validate:
+            if not 0 < len(image_urls) <= images_per_carousel * max_messages:
+                raise ValueError("An image carousel must have 1 to {} images".format(
+                    images_per_carousel * max_messages))
+            for image_url in image_urls:
+                _validate_image(ratio, image_url, alt_text)
+
+        # one carousel message for every ten images
+        messages = budget_reply(budget_flex(
+            alt_text, [create_image_bubble(ratio, image_url) for image_url in image_urls],
+            max_bubbles=images_per_carousel))
+
+    else:
+        raise ValueError(command_type + " commands can't be built in advance")
+
+    return join(messages)
@@ -0,0 +1,71 @@
+import os
+
+# alias -> command name, more can be added with
+# COMMAND_ALIASES="alias=name,alias=name"
+aliases = {
+    'bantuan': 'help',
+    'nowplaying': 'nowshowing',
+    'upcoming': 'upcomingmovies',
+}
+aliases.update(
+    pair.strip().lower().split('=', 1)
+    for pair in os.environ.get('COMMAND_ALIASES', '').split(',') if '=' in pair)
+
+# names shorter than this are never corrected, "?a" is more likely chatter than a typo
+min_suggestion_length = 4
+
+
+def _deletes(word):
+    '''
+    every string that can be made by removing one character from word
+    '''
+    return {word[:i] + word[i+1:] for i in range(len(word))}
+
+
+class CommandResolver:
+    '''
+    resolves command names without touching the database
+
+    names within one edit (insertion, deletion, substitution, or swapping two
+    neighbouring characters) of a command or alias are suggested using an index
+    of every name with one character removed, e.g. "agneda" and "agenda" both
+    become "agnda".
+    '''
+
+    def __init__(self, names, aliases=aliases):
+        self.names = frozenset(names)
+        self.aliases = {alias: name for alias, name in aliases.items()
+                        if name in self.names and alias not in self.names}
+
+        self.index = {}
+        for name in self.names | self.aliases.keys():
+            for variant in _deletes(name) | {name}:
+                self.index.setdefault(variant, set()).add(name)
+
+        self.max_length = max(map(len, self.index), default=0) + 1
+
+    def resolve(self, text):
+        '''
+        returns: (command name, None) for a command or an alias,
+        (None, suggested command name) for a near miss,
+        and (None, None) for anything else
+        '''
+        if text in self.names:
+            return text, None
+        if text in self.aliases:
+            return self.aliases[text], None
+
+        if len(text) < min_suggestion_length or len(text) > self.max_length:
+            return None, None
+
+        candidates = set()
+        for variant in _deletes(text) | {text}:
+            candidates |= self.index.get(variant, set())
+
+        if not candidates:
+            return None, None
+
+        # prefer the candidate closest in length, then alphabetically so the
+        # same typo always gets the same suggestion
+        best = min(candidates, key=lambda name: (abs(len(name) - len(text)), name))
+        return None, self.aliases.get(best, best)
@@ -0,0 +1,92 @@
+import os
+import time
+import threading
+
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN
+from psycopg2.pool import ThreadedConnectionPool
+
+database_url = os.environ.get('DATABASE_URL')
+
+# connections opened per process, keep
+# (web workers + worker processes) * DB_POOL_MAX below the database's limit
+min_connections = int(os.environ.get('DB_POOL_MIN', 1))
+max_connections = int(os.environ.get('DB_POOL_MAX', 5))
+# connections idle for longer than this (in seconds) are pinged before use
+ping_after = float(os.environ.get('DB_POOL_PING_AFTER', 30))
+
+_pool = None
+_pool_pid = None
+_slots = None
+_last_used = {}
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool, _pool_pid, _slots
+
+    pid = os.getpid()
+    if _pool_pid != pid:
+        with _pool_lock:
+            if _pool_pid != pid:
+                # a pool inherited through fork (e.g. gunicorn --preload) shares
+                # its sockets with the parent, so it is dropped without closing
+                _pool = ThreadedConnectionPool(
+                    min_connections, max_connections, database_url)
+                _slots = threading.BoundedSemaphore(max_connections)
+                _last_used.clear()
+                _pool_pid = pid
+
+    return _pool, _slots
+
+
+def _is_healthy(connection):
+    if connection.closed or connection.get_transaction_status() == TRANSACTION_STATUS_UNKNOWN:
+        return False
+
+    if time.monotonic() - _last_used.get(id(connection), 0) < ping_after:
+        return True
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        connection.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+@contextmanager
+def get_connection():
+    '''
+    borrow a connection from this process's pool
+
+    waits when every connection is in use, and replaces connections
+    that were closed or dropped by the server until a healthy one is found.
+
+    usage:
+
+    with get_connection() as connection:
+        ...
+    '''
+    pool, slots = _get_pool()
+
+    with slots:
+        # after a restart of the database every idle connection may be dead,
+        # once they are all dropped the pool opens a new one
+        for _ in range(max_connections + 1):
+            connection = pool.getconn()
+            if _is_healthy(connection):
+                break
+            _last_used.pop(id(connection), None)
+            pool.putconn(connection, close=True)
+        else:
+            raise psycopg2.OperationalError("no healthy connection to the database")
+
+        try:
+            yield connection
+        finally:
+            _last_used[id(connection)] = time.monotonic()
+            pool.putconn(connection, close=bool(connection.closed))
@@ -1,20 +1,31 @@
 import os
+import threading
 
 from datetime import datetime, timedelta
 
 import psycopg2
-from linebot.models import SourceUser, SourceGroup
+from cachetools import LRUCache
 
-from chatbot.calendar_service import timezone
+from chatbot.utils import calendar_timezone as timezone
+from chatbot.connection_pool import get_connection
+from chatbot.notify_service import channel, subscribe, start_listener
 
-database_url = os.environ.get('DATABASE_URL')
-conn = psycopg2.connect(database_url)
+# (source type, id) -> clearance, None for sources that are not registered
+clearance_cache = LRUCache(
+    maxsize=int(os.environ.get('CLEARANCE_CACHE_SIZE', 1024)))
+clearance_cache_stats = {'hits': 0, 'misses': 0}
+# goes up whenever cached clearances are dropped, a lookup that ran
+# meanwhile may have read the old value and is not cached
+_clearance_generation = 0
+_clearance_lock = threading.Lock()
 
 
-def _run_query(connection, query: str, parameters: list = None) -> (bool, list):
-    """Runs queries, returns the result, handles exceptions"""
+def _run_query(query: str, parameters: list = None, log: bool = True) -> (bool, list):
+    """Runs queries on a pooled connection, returns the result, handles exceptions
 
-    assert connection is not None, "You need to define connection"
+    log=False leaves out the completed query, for queries that run all the time
+    or carry large payloads; failed queries are always printed
+    """
 
     assert isinstance(query, str), "Query must be in string"
 
@@ -28,112 +39,45 @@ def _run_query(connection, query: str, parameters: list = None) -> (bool, list):
     operation_succeed = False
     results = []
 
-    with connection.cursor() as cursor:
-        # as this is a generalised function for all kinds of query, we need to
-        # define cases when the query does not return anything.
-        # example of such case is when doing an update or delete query
-        try:
-            if parameters:
-                cursor.execute(query, parameters)
-            else:
-                cursor.execute(query)
-
-            if query_type == 'select':
-                results = cursor.fetchall()
-
-            connection.commit()
-            operation_succeed = True
-            print("Query completed: {}".format(cursor.query))
-
-        except (psycopg2.errors.SyntaxError, psycopg2.InternalError) as error:
-            connection.rollback()
-            print("Syntax or Internal Error: {}".format(error))
-            print("Query failed: {}".format(cursor.query))
-
-        except psycopg2.Error as other_errors:
-            connection.rollback()
-            print("Unspecified error: {}".format(other_errors))
-            print("Query failed: {}".format(cursor.query))
+    try:
+        with get_connection() as connection, connection.cursor() as cursor:
+            # as this is a generalised function for all kinds of query, we need to
+            # define cases when the query does not return anything.
+            # example of such case is when doing an update or delete query
+            try:
+                if parameters:
+                    cursor.execute(query, parameters)
+                else:
+                    cursor.execute(query)
+
+                # select queries and data-modifying queries with a RETURNING
+                # clause both produce rows to fetch
+                if cursor.description is not None:
+                    results = cursor.fetchall()
+
+                connection.commit()
+                operation_succeed = True
+                if log:
+                    print("Query completed: {}".format(cursor.query))
+
+            except (psycopg2.errors.SyntaxError, psycopg2.InternalError) as error:
+                connection.rollback()
+                print("Syntax or Internal Error: {}".format(error))
+                print("Query failed: {}".format(cursor.query))
+
+            except psycopg2.Error as other_errors:
+                # a dropped connection can't be rolled back, the pool replaces it
+                if not connection.closed:
+                    connection.rollback()
+                print("Unspecified error: {}".format(other_errors))
+                print("Query failed: {}".format(cursor.query))
+    except psycopg2.Error as error:
+        # no connection could be borrowed, e.g. the database is down
+        print("Connection error: {}".format(error))
 
     return operation_succeed, results
 
 
-def get_code(item: str) -> str:
-    '''
-    returns a code based on the item name
-    '''
-
-    query = "SELECT code FROM codes WHERE item=%s"
-    parameters = [item]
-
-    success, results = _run_query(conn, query, parameters)
-
-    if success:
-        return results[0][0]
-    else:
-        return "Gagal, coba lagi"
-
-
-def get_command(command_name) -> (int, str, str):
-    '''
-    get a command's type, content, and clearance based on the command name
-
-    returns (type, content, clearance)
-    '''
-
-    query = "SELECT type, content, clearance FROM commands WHERE name=%s"
-    parameters = [command_name]
-
-    # ensure that name is the primary key, therefore it will not return
-    # multiple commands
-    success, results = _run_query(conn, query, parameters)
-
-    if success:
-        return results[0]
-    else:
-        return None
-
-
-def get_command_description(command_name):
-    '''
-    get a command's description based on the command name
-
-    returns (description)
-    '''
-
-    query = "SELECT description FROM commands WHERE name=%s"
-    parameters = [command_name]
-
-    # ensure that name is the primary key, therefore it will not return
-    # multiple commands
-    success, results = _run_query(conn, query, parameters)
-
-    if success:
-        return results[0][0]
-    else:
-        return "-"
-
-
-def update_code(item, code):
-    '''
-    update a code
-
-    currently there are only these items:
-
-    - ruang_alat
-    - loker_doksos
-    - lemari_oren
-    - eneng
-    - cici
-
-    '''
-    query = "UPDATE codes SET code=%s WHERE item=%s"
-    parameters = [code, item]
-    success, _ = _run_query(conn, query, parameters)
-
-    return success
-
-
 def add_follower(user_id, user_name, user_type):
     '''
     add a follower to the database
@@ -147,7 +91,10 @@ def add_follower(user_id, user_name, user_type):
     '''
     query = """INSERT INTO followers (user_id, display_name, user_type) VALUES (%s,%s,%s)"""
     parameters = [user_id, user_name, user_type]
-    success, _ = _run_query(conn, query, parameters)
+    success, _ = _run_query(query, parameters)
+
+    if success:
+        invalidate_clearance('user', user_id)
 
     return success
 
@@ -162,7 +109,10 @@ def remove_follower(user_id):
 
     query = "DELETE FROM followers WHERE user_id=%s"
     parameters = [user_id]
-    success, _ = _run_query(conn, query, parameters)
+    success, _ = _run_query(query, parameters)
+
+    if success:
+        invalidate_clearance('user', user_id)
 
     return success
 
@@ -179,46 +129,143 @@ def add_group(group_id, group_name):
     get these parameters from the user message with !Register
     '''
 
-    cursor = conn.cursor()
+    registered = False
 
     try:
-        query = "SELECT * FROM groups WHERE group_id = '{}'".format(
-            group_id)
-        cursor.execute(query)
-        result = cursor.fetchone()
-        if (result):
-            print("Group is already registered")
-            return
-        else:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+
             try:
-                group_type = 0
-                query = """INSERT INTO groups (group_id, group_name, group_type) VALUES ('{}','{}',{})""".format(
-                    group_id, group_name, group_type)
-                cursor.execute(query)
-                conn.commit()
+                query = "SELECT * FROM groups WHERE group_id = %s"
+                cursor.execute(query, [group_id])
+                result = cursor.fetchone()
+                if (result):
+                    print("Group is already registered")
+                    return
+                else:
+                    try:
+                        group_type = 0
+                        query = """INSERT INTO groups (group_id, group_name, group_type) VALUES (%s,%s,%s)"""
+                        cursor.execute(query, [group_id, group_name, group_type])
+                        conn.commit()
+                        registered = True
+                    except (Exception, psycopg2.Error) as e:
+                        print("Error in update operation", e)
+                        print("Error: ", query)
+                    else:
+                        print("Query completed : '{}' ".format(query))
             except (Exception, psycopg2.Error) as e:
                 print("Error in update operation", e)
                 print("Error: ", query)
             else:
                 print("Query completed : '{}' ".format(query))
-    except (Exception, psycopg2.Error) as e:
-        print("Error in update operation", e)
-        print("Error: ", query)
-    else:
-        print("Query completed : '{}' ".format(query))
-    cursor.close()
+            cursor.close()
+    except psycopg2.Error as error:
+        print("Connection error: {}".format(error))
 
+    # outside of the block above, as notifying borrows another connection
+    if registered:
+        invalidate_clearance('group', group_id)
 
-def track_api_calls(api_call, user_id):
-    now = timezone.localize(datetime.now())
-    query = "INSERT INTO api_calls (timestamp, user_id, api_call) VALUES (%s, %s, %s)"
-    parameters = [now, user_id, api_call]
 
-    success, _ = _run_query(conn, query, parameters)
+def notify(topic, payload=''):
+    '''
+    tell every process listening through notify_service that `topic` changed
+
+    the notification is only delivered once the transaction commits
+    '''
+    query = "SELECT pg_notify(%s, %s)"
+    parameters = [channel, topic + ':' + payload]
+    success, _ = _run_query(query, parameters)
 
     return success
 
 
+def get_clearance(source_type, source_id):
+    '''
+    get the clearance of a user or a group, cached in clearance_cache
+
+    source_type parameters ->
+    'user' : looked up in followers
+    'group' : looked up in groups
+
+    returns: the user_type/group_type, or None if it is not registered
+    '''
+    key = (source_type, source_id)
+
+    with _clearance_lock:
+        if key in clearance_cache:
+            clearance_cache_stats['hits'] += 1
+            return clearance_cache[key]
+        clearance_cache_stats['misses'] += 1
+        generation = _clearance_generation
+
+    # cached entries are only safe while other processes' changes are heard
+    start_listener()
+
+    if source_type == 'group':
+        query = "SELECT group_type FROM groups WHERE group_id=%s"
+    else:
+        query = "SELECT user_type FROM followers WHERE user_id=%s"
+
+    success, results = _run_query(query, [source_id])
+
+    # don't cache failed lookups, only unregistered sources
+    if not success:
+        return None
+
+    clearance = results[0][0] if results else None
+    with _clearance_lock:
+        if generation == _clearance_generation:
+            clearance_cache[key] = clearance
+
+    return clearance
+
+
+def _drop_clearance(payload):
+    global _clearance_generation
+
+    with _clearance_lock:
+        _clearance_generation += 1
+        # a None payload means notifications may have been missed
+        if payload is None:
+            clearance_cache.clear()
+        else:
+            source_type, _, source_id = payload.partition(':')
+            clearance_cache.pop((source_type, source_id), None)
+
+
+subscribe('clearance', _drop_clearance)
+
+
+def invalidate_clearance(source_type, source_id):
+    '''
+    drop a cached clearance after the user or group has been changed,
+    in this process and in every other process through notify
+    '''
+    payload = source_type + ':' + source_id
+    _drop_clearance(payload)
+    notify('clearance', payload)
+
+
+def get_clearance_cache_stats():
+    '''
+    returns: dict of hits, misses, hit_rate, and size of the clearance cache
+    '''
+    with _clearance_lock:
+        hits = clearance_cache_stats['hits']
+        misses = clearance_cache_stats['misses']
+        size = len(clearance_cache)
+
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0,
+        'size': size,
+    }
+
+
 def authenticate(source, num):
     '''
     check whether the source is authenticated against num. 
@@ -231,41 +278,21 @@ def authenticate(source, num):
 
     returns: bool
     '''
-    query = ''
-
-    if isinstance(source, SourceGroup):
-        _from = "groups"
-        _where = "group_id"
-        _type = 'group_type'
-        _id = source.group_id
-        query = "SELECT * FROM groups WHERE group_id=%s"
-    elif isinstance(source, SourceUser):
-        _from = "followers"
-        _where = "user_id"
-        _type = "user_type"
-        _id = source.user_id
-        query = "SELECT * FROM followers WHERE user_id=%s"
+    if source.type == 'group':
+        clearance = get_clearance('group', source.group_id)
+    elif source.type == 'user':
+        clearance = get_clearance('user', source.user_id)
     # currently no support for rooms yet.
     else:
         return False
 
-    cursor = conn.cursor()
-
-    try:
-        cursor.execute(query, [_id])
-        result = cursor.fetchone()
-        cursor.close()
-        # check if result exists. if it doesn't that means the user is not registered yet.
-        if result:
-            # check user/group type
-            return bool(result[2] >= num)
-        else:
-            return False
+    # check if clearance exists. if it doesn't that means the user is not registered yet.
+    if clearance is not None:
+        # check user/group type
+        return bool(clearance >= num)
+    else:
+        return False
 
-    except (Exception, psycopg2.Error) as e:
-        print("Error in update operation", e)
-        print("Error: ", cursor.query)
-        cursor.close()
 
 def get_ordered_commands_by_frequency(max_days=None):
 
@@ -303,25 +330,29 @@ def get_ordered_commands_by_frequency(max_days=None):
     operation_succeed = False
     results = []
     # as _run_query does not support cte yet,
-    with conn.cursor() as cursor:
-        try:
-            cursor.execute(query, parameters)
-
-            results = cursor.fetchall()
-
-            conn.commit()
-            operation_succeed = True
-            print("Query completed: {}".format(cursor.query))
+    try:
+        with get_connection() as conn, conn.cursor() as cursor:
+            try:
+                cursor.execute(query, parameters)
 
-        except (psycopg2.errors.SyntaxError, psycopg2.InternalError) as error:
-            conn.rollback()
-            print("Syntax or Internal Error: {}".format(error))
-            print("Query failed: {}".format(cursor.query))
+                results = cursor.fetchall()
 
-        except psycopg2.Error as other_errors:
-            conn.rollback()
-            print("Unspecified error: {}".format(other_errors))
-            print("Query failed: {}".format(cursor.query))
+                conn.commit()
+                operation_succeed = True
+                print("Query completed: {}".format(cursor.query))
+
+            except (psycopg2.errors.SyntaxError, psycopg2.InternalError) as error:
+                conn.rollback()
+                print("Syntax or Internal Error: {}".format(error))
+                print("Query failed: {}".format(cursor.query))
+
+            except psycopg2.Error as other_errors:
+                if not conn.closed:
+                    conn.rollback()
+                print("Unspecified error: {}".format(other_errors))
+                print("Query failed: {}".format(cursor.query))
+    except psycopg2.Error as error:
+        print("Connection error: {}".format(error))
 
     if operation_succeed:
         return results
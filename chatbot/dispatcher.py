@@ -0,0 +1,61 @@
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+pool_size = int(os.environ.get('DISPATCHER_POOL_SIZE', 4))
+
+
+class EventDispatcher:
+    '''
+    runs webhook events in a bounded thread pool
+
+    events from the same chat (group, room, or user) are run one after
+    another in the order they were given, so replies within a chat keep
+    their order while different chats are handled concurrently.
+    '''
+
+    def __init__(self, dispatch, max_workers=pool_size):
+        self.dispatch = dispatch
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='dispatcher')
+
+    def _run_chat(self, events):
+        results = []
+        for event_id, destination, event in events:
+            start = time.perf_counter()
+            try:
+                self.dispatch(event, destination)
+                error = None
+            except Exception as e:
+                error = e
+            results.append((event_id, error, time.perf_counter() - start))
+        return results
+
+    def run(self, events):
+        '''
+        run a batch of events and wait for all of them to finish
+
+        parameters ->
+        events
+
+        events is a list of (event_id, source_id, destination, event)
+
+        returns: list of (event_id, error, latency in seconds),
+        error is None when the event was handled successfully
+        '''
+        chats = {}
+        for event_id, source_id, destination, event in events:
+            # events without a source can't clash with anything
+            key = source_id or event_id
+            chats.setdefault(key, []).append((event_id, destination, event))
+
+        futures = [self.executor.submit(self._run_chat, chat_events)
+                   for chat_events in chats.values()]
+
+        results = []
+        for future in futures:
+            results += future.result()
+
+        return results
@@ -0,0 +1,123 @@
+import os
+import time
+import difflib
+import threading
+
+from bisect import bisect_left
+
+from .movie_service import cinemas, get_now_showing, merge_now_showing
+from .showtime_snapshots import _today, get_today_snapshot
+from .titles import normalize_title
+from .tmdb_client import get_week
+
+# how alike a title has to be to be matched when nothing starts with the query
+fuzzy_cutoff = 0.6
+# seconds an index built from today's snapshots is kept, as they are not versioned
+snapshot_ttl = float(os.environ.get('FILM_SNAPSHOT_TTL', 300))
+
+# normalized title -> film, and the sorted normalized titles for prefix lookups
+_index = {}
+_titles = []
+# versions of the caches the index was built from,
+# and the day and ttl period when it was built from snapshots
+_built_from = None
+_lock = threading.Lock()
+
+
+def _now_showing():
+    '''
+    the cached now showing movies, or today's snapshots when nothing is cached yet
+    '''
+    cached = get_now_showing.cached_results()
+    if cached:
+        movies, _ = cached[0]
+        return movies
+
+    return merge_now_showing([(cinema_name, movies) for cinema_name, movies in (
+        (cinema_name, get_today_snapshot(cinema_name)) for cinema_name in cinemas) if movies])
+
+
+def build_index():
+    '''
+    index the films that are showing and the upcoming ones from TMDb by
+    normalized title, from what is already cached; nothing is scraped or fetched
+
+    a film in both takes its showing hours from now showing
+    and its release date from TMDb
+    '''
+    index = {}
+
+    for week in get_week.cached_results():
+        for movie in week:
+            index.setdefault(normalize_title(movie['title']), {
+                'title': movie['title'], 'release_date': movie.get('release_date')})
+
+    for movie in _now_showing():
+        key = normalize_title(movie['title'])
+        index[key] = dict(index.get(key, {}), **movie)
+
+    return index
+
+
+def _ensure_built():
+    global _index, _titles, _built_from
+
+    versions = (get_now_showing.version, get_week.version)
+    if not get_now_showing.cached_results():
+        # the snapshots change without a version, see _now_showing
+        versions += (_today(), int(time.time() // snapshot_ttl))
+
+    with _lock:
+        # the caches were refreshed since the index was built, or the snapshots may have changed
+        if versions != _built_from:
+            _index = build_index()
+            _titles = sorted(_index)
+            _built_from = versions
+
+        return _index, _titles
+
+
+def _is_showing(film):
+    return any(cinema_name in film for cinema_name in cinemas)
+
+
+def find_film(query):
+    '''
+    find a film by title, e.g. "spiderman" or "no way hom"
+
+    titles equal to the query win, then titles starting with it, shortest
+    first and showing films before upcoming ones, and then the title most
+    like it.
+
+    returns: dict of title, showing hours per cinema and release_date, or None
+    '''
+    index, titles = _ensure_built()
+    key = normalize_title(query)
+
+    if not key:
+        return None
+    if key in index:
+        return index[key]
+
+    start = bisect_left(titles, key)
+    matches = []
+    for title in titles[start:]:
+        if not title.startswith(key):
+            break
+        matches.append(title)
+
+    if not matches:
+        # any word of the title may start with the query, e.g. "no way home"
+        matches = [title for title in titles if (' ' + title).find(' ' + key) != -1]
+
+    if matches:
+        showing = [title for title in matches if _is_showing(index[title])]
+        return index[min(showing or matches, key=len)]
+
+    # the title most like the query, a showing film only wins among equally close ones
+    close = difflib.get_close_matches(key, titles, n=3, cutoff=fuzzy_cutoff)
+    if not close:
+        return None
+
+    return index[max(close, key=lambda title: (
+        difflib.SequenceMatcher(None, key, title).ratio(), _is_showing(index[title])))]
@@ -0,0 +1,120 @@
+import re
+import json
+
+
+class Slot:
+    '''
+    marks a value in a template skeleton that is filled in on render
+    '''
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Raw(str):
+    '''
+    already serialized json, inserted into a template as is
+    '''
+
+
+_slot_pattern = re.compile(r'"\\u0000slot:(\w+)\\u0000"')
+
+
+def _mark_slots(node):
+    if isinstance(node, Slot):
+        return '\x00slot:{}\x00'.format(node.name)
+    if isinstance(node, dict):
+        return {key: _mark_slots(value) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_mark_slots(value) for value in node]
+    return node
+
+
+def dumps(value):
+    '''
+    serialize a value the same way templates are serialized
+    '''
+    if isinstance(value, Raw):
+        return value
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+class FlexTemplate:
+    '''
+    a flex skeleton serialized to json once
+
+    rendering only serializes the values of its slots and joins them with
+    the precompiled fragments, so no dicts are built and nothing has to
+    go through the SDK's models before sending.
+
+    usage:
+
+    template = FlexTemplate({"type": "text", "text": Slot('text')})
+    template.render(text="Halo")  # '{"type":"text","text":"Halo"}'
+    '''
+
+    def __init__(self, skeleton):
+        parts = _slot_pattern.split(dumps(_mark_slots(skeleton)))
+        # split alternates between literal fragments and slot names
+        self.fragments = parts[0::2]
+        self.slots = parts[1::2]
+
+    def render(self, **values):
+        rendered = [self.fragments[0]]
+        for slot, fragment in zip(self.slots, self.fragments[1:]):
+            rendered.append(dumps(values[slot]))
+            rendered.append(fragment)
+        return Raw(''.join(rendered))
+
+
+def join(items):
+    '''
+    serialize a list of already serialized items
+    '''
+    return Raw('[' + ','.join(items) + ']')
+
+
+carousel_template = FlexTemplate({
+    "type": "carousel",
+    "contents": Slot('contents')
+})
+
+vertical_bubble_template = FlexTemplate({
+    "type": "bubble",
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "spacing": "md",
+        "contents": Slot('contents')
+    },
+})
+
+text_message_template = FlexTemplate({
+    "type": "text",
+    "text": Slot('text')
+})
+
+flex_message_template = FlexTemplate({
+    "type": "flex",
+    "altText": Slot('alt_text'),
+    "contents": Slot('contents')
+})
+
+
+def create_carousel(bubbles):
+    return carousel_template.render(contents=join(bubbles))
+
+
+def create_vertical_bubble(contents):
+    return vertical_bubble_template.render(contents=join(contents))
+
+
+def create_flex_message(alt_text, contents):
+    '''
+    create a ready to send flex message from a serialized bubble or carousel
+    '''
+    return flex_message_template.render(alt_text=alt_text, contents=contents)
+
+
+def create_text_message(text):
+    return text_message_template.render(text=text)
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+from urllib.parse import urlencode
+
+cache_dir = os.environ.get('HTTP_CACHE_DIR', os.path.join(
+    tempfile.gettempdir(), 'samantha-http-cache'))
+# seconds a saved response is used without asking the server
+max_age = float(os.environ.get('HTTP_CACHE_MAX_AGE', 600))
+# seconds after which a saved response is deleted
+expire_after = float(os.environ.get('HTTP_CACHE_EXPIRE', 7 * 86400))
+
+stats = {'hits': 0, 'revalidations': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        stats[name] += 1
+
+
+def get_http_cache_stats():
+    '''
+    returns: dict of hits, revalidations (answered 304) and misses,
+    counted since the process started
+    '''
+    with _stats_lock:
+        return dict(stats)
+
+
+def _path(url, params):
+    # the key may hold an api key, so only its hash is written to disk
+    key = url + '?' + urlencode(sorted((params or {}).items()))
+    return os.path.join(cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+
+def _load(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(path, entry):
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # written to a temporary file first, so other processes never read half of it
+        descriptor, temporary_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(temporary_path, path)
+    except OSError as error:
+        print("Saving {} to the http cache failed: {}".format(entry['url'], error))
+        return
+
+    _prune()
+
+
+def _prune():
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            if now - os.path.getmtime(path) > expire_after:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def cached_get(session, url, params=None, max_age=max_age, **kwargs):
+    '''
+    GET a url through the on-disk cache, returns the body as text
+
+    a response younger than max_age seconds is used as it is. an older one
+    is revalidated with If-None-Match/If-Modified-Since, and only fetched
+    again if the server says it changed. error responses raise and are not
+    saved.
+
+    kwargs are passed on to session.get, e.g. timeout
+    '''
+    path = _path(url, params)
+    entry = _load(path)
+
+    headers = {}
+    if entry:
+        if time.time() - entry['fetched_at'] < max_age:
+            _count('hits')
+            return entry['body']
+
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    response = session.get(url, params=params, headers=headers, **kwargs)
+
+    if entry and response.status_code == 304:
+        _count('revalidations')
+        entry['fetched_at'] = time.time()
+        _save(path, entry)
+        return entry['body']
+
+    response.raise_for_status()
+    _count('misses')
+
+    _save(path, {
+        'url': url,
+        'fetched_at': time.time(),
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'body': response.text,
+    })
+
+    return response.text
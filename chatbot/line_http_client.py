@@ -0,0 +1,160 @@
+import os
+import re
+import time
+import random
+import threading
+
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+
+# messaging api, override to point the bot at a local stand-in server
+line_api_endpoint = os.environ.get('LINE_API_ENDPOINT', 'https://api.line.me')
+
+connect_timeout = float(os.environ.get('LINE_API_CONNECT_TIMEOUT', 3))
+read_timeout = float(os.environ.get('LINE_API_READ_TIMEOUT', 10))
+# connections kept open to the api, at least one per dispatcher thread
+pool_size = int(os.environ.get('LINE_API_POOL_SIZE', 10))
+max_retries = int(os.environ.get('LINE_API_MAX_RETRIES', 3))
+# seconds, the first retry waits up to base_delay and every next one twice as long
+base_delay = float(os.environ.get('LINE_API_RETRY_DELAY', 0.5))
+max_delay = float(os.environ.get('LINE_API_MAX_RETRY_DELAY', 10))
+
+retry_statuses = (429, 500, 502, 503, 504)
+
+# user, group and room ids in paths are counted under one endpoint
+id_pattern = re.compile(r'/[UCR][0-9a-f]{32}')
+
+# endpoint -> counters, see get_line_api_stats
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_endpoint_name(method, url):
+    '''
+    e.g. GET /v2/bot/profile/{id}
+    '''
+    return method + ' ' + id_pattern.sub('/{id}', urlparse(url).path)
+
+
+def _record(endpoint, latency, error=False, retried=False):
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, {
+            'calls': 0, 'errors': 0, 'retries': 0, 'total_latency': 0.0, 'max_latency': 0.0})
+        stats['calls'] += 1
+        stats['errors'] += error
+        stats['retries'] += retried
+        stats['total_latency'] += latency
+        stats['max_latency'] = max(stats['max_latency'], latency)
+
+
+def get_line_api_stats():
+    '''
+    returns: dict of endpoint -> calls, errors, retries, mean_latency and max_latency,
+    counting every attempt of a request
+    '''
+    with _stats_lock:
+        return {endpoint: {
+            'calls': stats['calls'],
+            'errors': stats['errors'],
+            'retries': stats['retries'],
+            'mean_latency': stats['total_latency'] / stats['calls'],
+            'max_latency': stats['max_latency'],
+        } for endpoint, stats in _stats.items()}
+
+
+def _never_sent(error):
+    '''
+    whether the request failed before a connection to the api was made
+    '''
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def get_retry_delay(attempt, retry_after=None):
+    '''
+    seconds to wait before retrying, honouring the server's Retry-After,
+    otherwise a random delay up to an exponentially growing ceiling
+    '''
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0), max_delay)
+
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class PooledHttpClient(RequestsHttpClient):
+    '''
+    http client for LineBotApi, keeping connections to the api open in a pool
+
+    failed requests are retried up to max_retries times. GET, PUT and DELETE
+    are always retried, but a POST is only retried when it can't have been
+    handled twice: when it was rate limited (429), when the connection was
+    never made, or when it carries an X-Line-Retry-Key.
+    '''
+
+    def __init__(self, timeout=(connect_timeout, read_timeout)):
+        super(PooledHttpClient, self).__init__(timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _request(self, method, url, headers=None, timeout=None, **kwargs):
+        endpoint = get_endpoint_name(method, url)
+        safe = method in ('GET', 'PUT', 'DELETE') or 'X-Line-Retry-Key' in (headers or {})
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, url, headers=headers, timeout=timeout or self.timeout, **kwargs)
+            except requests.exceptions.RequestException as error:
+                retry = attempt < max_retries and (safe or _never_sent(error))
+                _record(endpoint, time.perf_counter() - start, error=True, retried=retry)
+                if not retry:
+                    raise
+                delay = get_retry_delay(attempt)
+                print("{} failed: {}, retrying in {:.2f}s".format(endpoint, error, delay))
+            else:
+                failed = response.status_code >= 400
+                retry = attempt < max_retries and response.status_code in retry_statuses and (
+                    safe or response.status_code == 429)
+                _record(endpoint, time.perf_counter() - start, error=failed, retried=retry)
+                if not retry:
+                    return RequestsHttpResponse(response)
+                delay = get_retry_delay(attempt, response.headers.get('Retry-After'))
+                print("{} returned {}, retrying in {:.2f}s".format(
+                    endpoint, response.status_code, delay))
+                response.close()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        return self._request('GET', url, headers=headers, params=params, stream=stream, timeout=timeout)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return self._request('POST', url, headers=headers, data=data, timeout=timeout)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        return self._request('DELETE', url, headers=headers, data=data, timeout=timeout)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        return self._request('PUT', url, headers=headers, data=data, timeout=timeout)
@@ -1,370 +1,387 @@
 import os
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from bs4.element import Tag
-from cachetools.func import ttl_cache
 
 import requests
 
-movie_api_key = os.environ.get('MOVIE_API_KEY')
+from .flex_templates import (
+    FlexTemplate, Slot, join, create_carousel, create_vertical_bubble
+)
+from .http_cache import cached_get
+from .refresh_service import refreshing_cache
+from .showtime_snapshots import diff_movies, get_today_snapshot, save_snapshot
+from .titles import normalize_title
 
 url_xxi_ciwalk = 'https://21cineplex.com/theater/bioskop-ciwalk-xxi,249,BDGCIWL.htm'
 url_cgv_bec = 'https://www.cgv.id/en/schedule/cinema/014'
 url_cgv_pvj = 'https://www.cgv.id/en/schedule/cinema/001'
 
 
-@ttl_cache(maxsize=4, ttl=14400)
-def get_now_showing():
-    '''Find ongoing movies in several cinemas in Bandung (CGV PVJ, CGV BEC, and XXI Ciwalk).
+# seconds, a site is given up on when it doesn't answer within site_timeout,
+# and every site still loading after scrape_deadline is left out
+site_timeout = float(os.environ.get('SCRAPE_SITE_TIMEOUT', 10))
+scrape_deadline = float(os.environ.get('SCRAPE_DEADLINE', 15))
 
-    Returns a set of movies with title, schedule, and the cinema its playing at.
-    '''
+session = requests.Session()
+session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=3))
 
-    def add_movies_to_now_showing(now_showing, movie_to_be_added, cinema_name):
-        '''A nested function to add movies to the now showing list.
-        '''
-        movie_exists = next(
-            (movie for movie in now_showing if movie['title'] == movie_to_be_added['title']), None)
+_scrape_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='scrape')
 
-        if movie_exists:
-            movie_exists[cinema_name] = movie_to_be_added[cinema_name]
-        else:
-            now_showing.append(movie_to_be_added)
+# lxml is a lot faster, html.parser is used where it isn't installed
+try:
+    import lxml  # noqa: F401
+    html_parser = 'lxml'
+except ImportError:
+    html_parser = 'html.parser'
 
-    def add_cgv_movies(movies_list, cinema_name):
-        ''' A nested function add cgv movies to the now showing list. 
+xxi_panel_class = 'tab-pane fade show active panel-reguler'
+xxi_strainer = SoupStrainer('div', class_=xxi_panel_class)
+cgv_strainer = SoupStrainer(class_='schedule-lists')
 
-        Different function since there is a need to restructure the data separately. (Different format)
-        '''
-        for i in movies_list:
-            if isinstance(i, Tag):
-                sched = i.find(class_='showtime-lists')
 
-                movie_to_be_added = {
-                    'title': i.div.a.getText().strip().upper(),
-                    cinema_name: sched.getText().split()
-                }
+def fetch_page(url):
+    try:
+        return cached_get(session, url, timeout=site_timeout)
+    except requests.exceptions.SSLError:
+        # workaround for ssl error in xxi website
+        return cached_get(session, url, timeout=site_timeout, verify=False)
 
-                add_movies_to_now_showing(
-                    now_showing, movie_to_be_added, cinema_name)
 
-    # workaround for ssl error in xxi website
+def parse_xxi_movies(html):
+    '''
+    returns: list of (title, showing hours) of a 21cineplex theater page
+    '''
+    # only the regular screenings tab is built into a tree
+    page = BeautifulSoup(html, html_parser, parse_only=xxi_strainer)
     try:
-        xxi_ciwalk = requests.get(url_xxi_ciwalk)
-    except:
-        xxi_ciwalk = requests.get(url_xxi_ciwalk, verify=False)
+        movies = page.find(class_=xxi_panel_class).find_all(class_='col-9')
 
-    cgv_pvj = requests.get(url_cgv_pvj)
-    cgv_bec = requests.get(url_cgv_bec)
+        return [(movie.h3.text.upper().strip(), [hours.text for hours in movie.find_all('a')])
+                for movie in movies if movie.h3.text]
+    finally:
+        page.decompose()
 
-    # must add robustness. Currently if there's no movie listed the bot doesnt return anything.
 
-    movies_xxi_ciwalk = BeautifulSoup(xxi_ciwalk.text, 'html.parser')
-    movies_cgv_pvj = BeautifulSoup(cgv_pvj.text, 'html.parser')
-    movies_cgv_bec = BeautifulSoup(cgv_bec.text, 'html.parser')
+def parse_cgv_movies(html):
+    '''
+    returns: list of (title, showing hours) of a cgv schedule page
+    '''
+    # only the schedule list is built into a tree
+    page = BeautifulSoup(html, html_parser, parse_only=cgv_strainer)
+    try:
+        movies = page.find(class_='schedule-lists').ul
 
-    movies_xxi_ciwalk = movies_xxi_ciwalk.find(
-        class_='tab-pane fade show active panel-reguler').find_all(class_='col-9')
-    movies_cgv_pvj = movies_cgv_pvj.find(class_='schedule-lists').ul
-    movies_cgv_bec = movies_cgv_bec.find(class_='schedule-lists').ul
+        return [(movie.div.a.getText().strip().upper(), movie.find(class_='showtime-lists').getText().split())
+                for movie in movies if isinstance(movie, Tag)]
+    finally:
+        page.decompose()
 
-    now_showing = []
 
-    # new website
-    for movie in movies_xxi_ciwalk:
-        if (movie.h3.text):
+# cinema name -> (url, parser), in the order their movies are merged
+cinemas = {
+    'Ciwalk XXI': (url_xxi_ciwalk, parse_xxi_movies),
+    'CGV BEC': (url_cgv_bec, parse_cgv_movies),
+    'CGV PVJ': (url_cgv_pvj, parse_cgv_movies),
+}
 
-            # create a new list to be added later
-            schedule_lists = []
-            # get showing hours from collected data
-            showing_hours = movie.find_all('a')
 
-            # add showing hours to the list
-            for hours in showing_hours:
-                schedule_lists.append(hours.text)
+def scrape_cinema(cinema_name):
+    url, parse = cinemas[cinema_name]
+    return parse(fetch_page(url))
 
-            movie_to_be_added = {
-                'title': movie.h3.text.upper().strip(),
-                'Ciwalk XXI': schedule_lists
-            }
 
-            add_movies_to_now_showing(
-                now_showing, movie_to_be_added, 'Ciwalk XXI')
+def record_snapshot(cinema_name, movies):
+    '''
+    save the movies scraped from a cinema, and print how they changed
+    since the snapshot before
+    '''
+    previous = save_snapshot(cinema_name, movies)
 
-    add_cgv_movies(movies_cgv_bec, 'CGV BEC')
-    add_cgv_movies(movies_cgv_pvj, 'CGV PVJ')
+    if previous:
+        added, removed, changed = diff_movies(previous[2], movies)
+        if added or removed or changed:
+            print("{}: added {}, removed {}, other showing hours for {}".format(
+                cinema_name, added, removed, changed))
 
-    sorted_now_showing = sorted(now_showing, key=lambda k: k['title'])
 
-    return sorted_now_showing
+def merge_now_showing(scraped):
+    '''
+    merge the movies of every cinema into one list, a movie per normalized title
 
+    scraped is a list of (cinema name, list of (title, showing hours)), a movie
+    takes the title it is first listed with. showing hours of a movie listed
+    more than once by a cinema, e.g. in 2D and in atmos, are put together.
 
-@ttl_cache(maxsize=4, ttl=3600)
-def discover_movies(start_date=None, end_date=None, region='ID'):
-    """Find movies based on several parameters. start_date, end_date, and region"""
+    returns: list of movies with title and showing hours per cinema, sorted by title
+    '''
+    index = {}
 
-    # url and default parameter (api key is required)
-    url = "https://api.themoviedb.org/3/discover/movie"
-    params = {
-        'api_key': movie_api_key,
-        'sort_by': 'release_date.asc'
-    }
-    # additional parameters
-    if start_date:
-        params['release_date.gte'] = start_date
-    if end_date:
-        params['release_date.lte'] = end_date
-    if region:
-        params['region'] = region
-    # send request and return response
-    response = requests.get(url, params=params)
-    return response.json()['results']
-
-
-def create_now_showing_carousel(movies):
-
-    # initiate variables
-    counter = 0
-    bubbles = []
-    three_movies_section = []
-    three_movies_section.append({
-        "type": "text",
-        "text": datetime.now().strftime('NOW SHOWING\n (%a, %d %b)'),
-        "weight": "bold",
-        "wrap": True,
-        "size": "sm",
-        "align": "center"
-    })
-
-    length = len(movies)
-    length_counter = 0
-
-    for movie in movies:
-
-        length_counter = length_counter + 1
-        contents = []
-
-        val_cgv_pvj = movie.get('CGV PVJ')
-        val_cgv_bec = movie.get('CGV BEC')
-        val_ciwalk_xxi = movie.get('Ciwalk XXI')
-
-        if val_cgv_pvj:
-            content = []
-            content.append({
-                "type": "text",
-                "text": "CGV PVJ",
-                "wrap": True,
-                "gravity": "center",
-                "size": "sm",
-                "color": "#444444",
-                "flex": 2
-            })
-            content.append({
-                "type": "text",
-                "wrap": True,
-                "gravity": "center",
-                "text": ' '.join(val_cgv_pvj),
-                "size": "xs",
-                "flex": 4
-            })
-
-            contents.append({
-                "type": "box",
-                "layout": "horizontal",
-                "contents": content
-            })
-
-        if val_cgv_bec:
-            content = []
-            content.append({
-                "type": "text",
-                "text": "CGV BEC",
-                "wrap": True,
-                "gravity": "center",
-                "size": "sm",
-                "color": "#444444",
-                "flex": 2
-            })
-            content.append({
-                "type": "text",
-                "wrap": True,
-                "gravity": "center",
-                "text": ' '.join(val_cgv_bec),
-                "size": "xs",
-                "flex": 4
-            })
-
-            contents.append({
-                "type": "box",
-                "layout": "horizontal",
-                "contents": content
-            })
-
-        if val_ciwalk_xxi:
-            content = []
-            content.append({
-                "type": "text",
-                "text": "Ciwalk XXI",
-                "wrap": True,
-                "gravity": "center",
-                "size": "sm",
-                "color": "#444444",
-                "flex": 2
-            })
-            content.append({
-                "type": "text",
-                "wrap": True,
-                "gravity": "center",
-                "text": ' '.join(val_ciwalk_xxi),
-                "size": "xs",
-                "flex": 4
-            })
-
-            contents.append({
-                "type": "box",
-                "layout": "horizontal",
-                "contents": content
-            })
-
-        # add the movies
-
-        three_movies_section.append({
-            "type": "separator",
-        })
-        three_movies_section.append({
-            "type": "text",
-            "text": movie['title'],
-            'wrap': True,
-            "weight": "bold",
-            "size": "sm"
-        })
+    for cinema_name, movies in scraped:
+        for title, schedule in movies:
+            key = normalize_title(title)
 
-        three_movies_section.append({
-            "type": "box",
-            "layout": "vertical",
-            "spacing": "md",
-            "contents": contents
-        })
-
-        # increment counter
-        counter = counter + 1
-
-        # if counter has reached 3
-        if counter == 3:
-            bubbles.append({
-                "type": "bubble",
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "spacing": "md",
-                    "contents": three_movies_section
-                },
-            })
-
-            # reset counter
-            counter = 0
-
-            # reset three movies section
-            three_movies_section = []
-            three_movies_section.append({
-                "type": "text",
-                "text": datetime.now().strftime('NOW SHOWING\n (%a, %d %b)'),
-                "weight": "bold",
-                "wrap": True,
-                "size": "sm",
-                "align": "center"
-            })
-        elif length_counter == length:
-            bubbles.append({
-                "type": "bubble",
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "spacing": "md",
-                    "contents": three_movies_section
-                },
-            })
+            movie = index.get(key)
+            if movie is None:
+                movie = index[key] = {'title': title}
 
-    carousel = {
-        "type": "carousel",
-        "contents": bubbles
-    }
+            if movie.get(cinema_name):
+                movie[cinema_name] = sorted(set(movie[cinema_name]) | set(schedule))
+            else:
+                movie[cinema_name] = schedule
 
-    return carousel
+    return sorted(index.values(), key=lambda k: k['title'])
 
 
-def create_upcoming_movies_bubble(movie):
-    contents = []
-    # add title
-    contents.append({
-        "type": "text",
-        "text": movie['title'],
-        "weight": "bold",
-        "size": "sm",
-        "wrap": True
-    })
-
-    contents.append({
-        "type": "text",
-        "text": datetime.strptime(movie['release_date'], '%Y-%m-%d').strftime('%d %b %Y'),
-        "size": "xs"
-    })
-
-    bubble = {
-        "type": "bubble",
-        "hero": {
-                "type": "image",
-                "size": "full",
-                "aspectRatio": "2:3",
-                "aspectMode": "cover",
-                "action": {
-                    "type": "uri",
-                    "label": "Details..",
-                    "uri": "https://www.themoviedb.org/movie/{}".format(str(movie['id'])),
-                },
-            "url": "https://image.tmdb.org/t/p/w500{}".format(movie['poster_path'])
+def _cinema_movies(movies, cinema_name):
+    return [(movie['title'], movie[cinema_name]) for movie in movies if movie.get(cinema_name)]
+
+
+def now_showing_changed(old, new):
+    '''
+    whether a rebuilt now showing list has to be rendered again
+
+    every cinema's movies are diffed like its snapshots, by normalized title
+    and showing hours, so a title listed another way doesn't count. a cinema
+    left out or back in always does.
+    '''
+    (old_movies, old_missing), (new_movies, new_missing) = old, new
+    if list(old_missing) != list(new_missing):
+        return True
+
+    return any(any(diff_movies(_cinema_movies(old_movies, cinema_name), _cinema_movies(new_movies, cinema_name)))
+               for cinema_name in cinemas)
+
+
+@refreshing_cache('now_showing', ttl=14400, command='nowshowing', changed=now_showing_changed)
+def get_now_showing():
+    '''Find ongoing movies in several cinemas in Bandung (CGV PVJ, CGV BEC, and XXI Ciwalk).
+
+    The cinemas are scraped at the same time. A cinema that fails, or isn't done
+    within scrape_deadline, is left out instead of failing the whole list.
+
+    Returns a list of movies with title and schedule per cinema its playing at,
+    and a list of the cinemas that were left out.
+    '''
+
+    futures = {cinema_name: _scrape_executor.submit(scrape_cinema, cinema_name)
+               for cinema_name in cinemas}
+    done, _ = wait(futures.values(), timeout=scrape_deadline)
+
+    scraped = []
+    missing_cinemas = []
+
+    for cinema_name, future in futures.items():
+        if future in done and not future.exception():
+            movies = future.result()
+            record_snapshot(cinema_name, movies)
+            scraped.append((cinema_name, movies))
+            continue
+
+        if future not in done:
+            print("Scraping {} took longer than {}s".format(cinema_name, scrape_deadline))
+        else:
+            print("Scraping {} failed: {!r}".format(cinema_name, future.exception()))
+
+        # fall back to what the cinema listed earlier today
+        movies = get_today_snapshot(cinema_name)
+        if movies is not None:
+            print("Using today's last snapshot of {}".format(cinema_name))
+            scraped.append((cinema_name, movies))
+        else:
+            missing_cinemas.append(cinema_name)
+
+    return merge_now_showing(scraped), missing_cinemas
+
+
+now_showing_header_template = FlexTemplate({
+    "type": "text",
+    "text": Slot('date'),
+    "weight": "bold",
+    "wrap": True,
+    "size": "sm",
+    "align": "center"
+})
+
+cinema_schedule_template = FlexTemplate({
+    "type": "box",
+    "layout": "horizontal",
+    "contents": [
+        {
+            "type": "text",
+            "text": Slot('cinema'),
+            "wrap": True,
+            "gravity": "center",
+            "size": "sm",
+            "color": "#444444",
+            "flex": 2
         },
-        "body": {
-            "type": "box",
-            "layout": "horizontal",
-            "contents": [{
-                "type": "box",
-                "layout": "vertical",
-                "flex": 4,
-                "spacing": "sm",
-                "contents": contents
-            }, {
-                "type": "image",
-                "flex": 1,
-                "size": "xxs",
-                "aspectMode": "fit",
-                "url": "https://www.themoviedb.org/assets/2/v4/logos/293x302-powered-by-square-blue-ee05c47ab249273a6f9f1dcafec63daba386ca30544567629deb1809395d8516.png"
-            }]
+        {
+            "type": "text",
+            "wrap": True,
+            "gravity": "center",
+            "text": Slot('schedule'),
+            "size": "xs",
+            "flex": 4
         }
+    ]
+})
+
+missing_cinemas_template = FlexTemplate({
+    "type": "text",
+    "text": Slot('text'),
+    "wrap": True,
+    "size": "xs",
+    "align": "center",
+    "color": "#aa0000"
+})
+
+movie_separator = FlexTemplate({
+    "type": "separator",
+}).render()
+
+movie_title_template = FlexTemplate({
+    "type": "text",
+    "text": Slot('title'),
+    'wrap': True,
+    "weight": "bold",
+    "size": "sm"
+})
+
+movie_schedules_template = FlexTemplate({
+    "type": "box",
+    "layout": "vertical",
+    "spacing": "md",
+    "contents": Slot('contents')
+})
+
+upcoming_movie_template = FlexTemplate({
+    "type": "bubble",
+    "hero": {
+            "type": "image",
+            "size": "full",
+            "aspectRatio": "2:3",
+            "aspectMode": "cover",
+            "action": {
+                "type": "uri",
+                "label": "Details..",
+                "uri": Slot('uri'),
+            },
+        "url": Slot('poster_url')
+    },
+    "body": {
+        "type": "box",
+        "layout": "horizontal",
+        "contents": [{
+            "type": "box",
+            "layout": "vertical",
+            "flex": 4,
+            "spacing": "sm",
+            "contents": [
+                {
+                    "type": "text",
+                    "text": Slot('title'),
+                    "weight": "bold",
+                    "size": "sm",
+                    "wrap": True
+                },
+                {
+                    "type": "text",
+                    "text": Slot('release_date'),
+                    "size": "xs"
+                }
+            ]
+        }, {
+            "type": "image",
+            "flex": 1,
+            "size": "xxs",
+            "aspectMode": "fit",
+            "url": "https://www.themoviedb.org/assets/2/v4/logos/293x302-powered-by-square-blue-ee05c47ab249273a6f9f1dcafec63daba386ca30544567629deb1809395d8516.png"
+        }]
     }
+})
 
-    return bubble
+# the order cinemas are listed in for every movie
+cinema_names = ('CGV PVJ', 'CGV BEC', 'Ciwalk XXI')
 
 
-def create_upcoming_movies_carousel(movies):
+def create_now_showing_bubbles(movies, missing_cinemas=()):
+    '''
+    create serialized now showing bubbles, three movies per bubble
+
+    the first bubble says which cinemas couldn't be scraped, if any
+    '''
+    header = now_showing_header_template.render(
+        date=datetime.now().strftime('NOW SHOWING\n (%a, %d %b)'))
+
     bubbles = []
+    for i in range(0, max(len(movies), 1), 3):
+        three_movies_section = [header]
 
-    # create a counter to make sure it does not exceed 10 bubbles
-    counter = 0
-    for movie in movies:
-        if counter < 10:
-            bubbles.append(create_upcoming_movies_bubble(movie))
-        else:
-            break
-        counter = counter + 1
+        if i == 0 and missing_cinemas:
+            three_movies_section.append(missing_cinemas_template.render(
+                text="Jadwal {} belum bisa diambil".format(', '.join(missing_cinemas))))
 
-    carousel = {
-        "type": "carousel",
-        "contents": bubbles
-    }
+        for movie in movies[i:i+3]:
+            contents = [cinema_schedule_template.render(cinema=cinema_name, schedule=' '.join(movie[cinema_name]))
+                        for cinema_name in cinema_names if movie.get(cinema_name)]
+
+            # add the movies
+            three_movies_section.append(movie_separator)
+            three_movies_section.append(
+                movie_title_template.render(title=movie['title']))
+            three_movies_section.append(
+                movie_schedules_template.render(contents=join(contents)))
+
+        bubbles.append(create_vertical_bubble(three_movies_section))
+
+    return bubbles
+
+
+def create_now_showing_carousel(movies, missing_cinemas=()):
+    return create_carousel(create_now_showing_bubbles(movies, missing_cinemas))
+
+
+def create_film_bubble(film):
+    '''
+    create a serialized bubble of one movie found by film_index.find_film,
+    with its showing hours at every cinema, or its release date if it
+    isn't showing yet
+    '''
+    contents = [movie_title_template.render(title=film['title']), movie_separator]
+
+    schedules = [cinema_schedule_template.render(cinema=cinema_name, schedule=' '.join(film[cinema_name]))
+                 for cinema_name in cinema_names if film.get(cinema_name)]
+    if schedules:
+        contents.append(movie_schedules_template.render(contents=join(schedules)))
+    elif film.get('release_date'):
+        contents.append(cinema_schedule_template.render(
+            cinema="Rilis", schedule=datetime.strptime(film['release_date'], '%Y-%m-%d').strftime('%d %b %Y')))
+    else:
+        contents.append(cinema_schedule_template.render(cinema="Jadwal", schedule="Belum ada"))
+
+    return create_vertical_bubble(contents)
+
+
+def create_upcoming_movies_bubble(movie):
+    return upcoming_movie_template.render(
+        title=movie['title'],
+        release_date=datetime.strptime(
+            movie['release_date'], '%Y-%m-%d').strftime('%d %b %Y'),
+        uri="https://www.themoviedb.org/movie/{}".format(str(movie['id'])),
+        poster_url="https://image.tmdb.org/t/p/w500{}".format(movie['poster_path']))
+
+
+def create_upcoming_movies_bubbles(movies):
+    # every movie gets a bubble, the bot sends them a page at a time
+    return [create_upcoming_movies_bubble(movie) for movie in movies]
 
-    return carousel
+
+def create_upcoming_movies_carousel(movies):
+    # make sure it does not exceed 10 bubbles
+    return create_carousel(create_upcoming_movies_bubbles(movies[:10]))
 
     # -- legacy -- (old website 21)
 
@@ -0,0 +1,78 @@
+import os
+import time
+import select
+import threading
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+database_url = os.environ.get('DATABASE_URL')
+
+# every change is sent on this channel as "topic:payload",
+# see database_service.notify
+channel = 'samantha_changes'
+
+_subscribers = {}
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def subscribe(topic, callback):
+    '''
+    call `callback(payload)` whenever a change on `topic` is notified
+
+    after a reconnect callbacks are called with None as the payload,
+    since notifications sent while disconnected are lost.
+    '''
+    _subscribers.setdefault(topic, []).append(callback)
+
+
+def _publish(topic, payload):
+    for callback in _subscribers.get(topic, []):
+        try:
+            callback(payload)
+        except Exception as e:
+            print("Notification callback for {} failed: {}".format(topic, e))
+
+
+def _listen():
+    reconnecting = False
+
+    while True:
+        try:
+            connection = psycopg2.connect(database_url)
+            connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with connection.cursor() as cursor:
+                cursor.execute("LISTEN " + channel)
+
+            if reconnecting:
+                for topic in list(_subscribers):
+                    _publish(topic, None)
+
+            while True:
+                if select.select([connection], [], [], 60) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notification = connection.notifies.pop(0)
+                    topic, _, payload = notification.payload.partition(':')
+                    _publish(topic, payload)
+
+        except psycopg2.Error as e:
+            print("Notification listener disconnected: {}".format(e))
+            reconnecting = True
+            time.sleep(5)
+
+
+def start_listener():
+    '''
+    start listening for change notifications in a background thread,
+    only one listener is started per process
+    '''
+    global _listener
+
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(
+                target=_listen, name='notify-listener', daemon=True)
+            _listener.start()
@@ -0,0 +1,198 @@
+import os
+import time
+import threading
+
+from urllib.parse import urlencode
+
+from cachetools import LRUCache
+
+from .database_service import _run_query, notify
+from .notify_service import subscribe
+from .flex_templates import FlexTemplate, Slot, create_text_message, join
+from .payload_budget import (
+    budget_flex, budget_reply, max_bubbles_per_carousel, max_messages, pack_carousels
+)
+
+# one bubble of every page is taken by the "next page" button,
+# pages of big bubbles get fewer so the reply stays within max_messages
+bubbles_per_page = max_bubbles_per_carousel - 1
+
+# query_key, page -> (payload, clearance, expiry timestamp)
+_pages = LRUCache(maxsize=int(os.environ.get('PAGE_CACHE_SIZE', 256)))
+_pages_lock = threading.Lock()
+
+next_page_bubble_template = FlexTemplate({
+    "type": "bubble",
+    "body": {
+        "type": "box",
+        "layout": "vertical",
+        "justifyContent": "center",
+        "contents": [
+            {
+                "type": "text",
+                "text": Slot('remaining'),
+                "wrap": True,
+                "align": "center",
+                "size": "sm",
+                "color": "#444444"
+            }
+        ]
+    },
+    "footer": {
+        "type": "box",
+        "layout": "vertical",
+        "contents": [
+            {
+                "type": "button",
+                "style": "primary",
+                "action": {
+                    "type": "postback",
+                    "label": "Selanjutnya",
+                    "data": Slot('data'),
+                    "displayText": "Selanjutnya"
+                }
+            }
+        ]
+    }
+})
+
+
+def create_page_data(query_key, page):
+    '''
+    the postback data of a "next page" button, read by handle_postback in bot.py
+    '''
+    return urlencode({'action': 'page', 'key': query_key, 'page': page})
+
+
+def create_next_page_bubble(query_key, remaining, page):
+    return next_page_bubble_template.render(
+        remaining="Masih ada {} lagi".format(remaining),
+        data=create_page_data(query_key, page))
+
+
+def _fits(bubbles):
+    return len(pack_carousels(bubbles)) <= max_messages
+
+
+def paginate(query_key, alt_text, bubbles, as_carousel=True):
+    '''
+    split bubbles into pages that are sent one reply at a time,
+    every page but the last ends with a "next page" button
+
+    a page holds as many bubbles as fit in one reply by count and size,
+    up to bubbles_per_page, with room left for the button
+
+    returns: list of serialized lists of messages
+    '''
+    if not bubbles:
+        return [join([create_text_message("Belum ada yang bisa ditampilkan")])]
+
+    # the biggest button a page can end with, room is left for it on every page
+    widest_button = create_next_page_bubble(query_key, len(bubbles), len(bubbles))
+
+    # (start, end) of the bubbles of every page
+    sections = []
+    start = 0
+    while start < len(bubbles):
+        rest = bubbles[start:]
+        if len(rest) <= bubbles_per_page and _fits(rest):
+            sections.append((start, len(bubbles)))
+            break
+
+        # a page has at least one bubble, which always fits with the button
+        end = start + 1
+        while end - start < bubbles_per_page and _fits(bubbles[start:end + 1] + [widest_button]):
+            end += 1
+        sections.append((start, end))
+        start = end
+
+    pages = []
+    for number, (start, end) in enumerate(sections, start=1):
+        section = bubbles[start:end]
+        if end < len(bubbles):
+            section = section + [create_next_page_bubble(query_key, len(bubbles) - end, number + 1)]
+
+        pages.append(join(budget_reply(
+            budget_flex(alt_text, section, as_carousel=as_carousel or len(sections) > 1))))
+
+    return pages
+
+
+def store_pages(query_key, pages, ttl, clearance=1):
+    '''
+    save every page of a reply, replacing the ones saved before for that query
+
+    parameters ->
+    query_key,
+    pages,
+    ttl,
+    clearance
+
+    ttl is in seconds, and clearance is needed to be sent the pages
+    '''
+    expires_at = time.time() + ttl
+
+    query = "DELETE FROM reply_pages WHERE query_key=%s OR expires_at < now(); " + \
+        "INSERT INTO reply_pages (query_key, page, clearance, payload, expires_at) VALUES " + \
+        ', '.join(['(%s, %s, %s, %s, to_timestamp(%s))'] * len(pages))
+    parameters = [query_key]
+    for number, payload in enumerate(pages, start=1):
+        parameters += [query_key, number, clearance, payload, expires_at]
+
+    success, _ = _run_query(query, parameters, log=False)
+
+    with _pages_lock:
+        for number, payload in enumerate(pages, start=1):
+            _pages[(query_key, number)] = (payload, clearance, expires_at)
+
+    return success
+
+
+def get_page(query_key, page):
+    '''
+    get a saved page
+
+    returns (payload, clearance), or None if it expired or was never saved
+    '''
+    key = (query_key, page)
+
+    with _pages_lock:
+        cached = _pages.get(key)
+    if cached and cached[2] > time.time():
+        return cached[:2]
+
+    query = "SELECT payload, clearance, extract(epoch FROM expires_at) FROM reply_pages " + \
+        "WHERE query_key=%s AND page=%s AND expires_at > now()"
+    success, results = _run_query(query, [query_key, page], log=False)
+
+    if success and results:
+        payload, clearance, expires_at = results[0]
+        with _pages_lock:
+            _pages[key] = (payload, clearance, float(expires_at))
+        return payload, clearance
+    else:
+        return None
+
+
+def _drop_local_pages(prefix):
+    with _pages_lock:
+        # a None prefix means notifications may have been missed
+        for key in [key for key in _pages if prefix is None or key[0].startswith(prefix)]:
+            del _pages[key]
+
+
+subscribe('pages', _drop_local_pages)
+
+
+def drop_pages(prefix):
+    '''
+    drop every saved page of the queries starting with prefix,
+    e.g. after the data they were rendered from changed
+    '''
+    success, _ = _run_query(
+        "DELETE FROM reply_pages WHERE query_key LIKE %s", [prefix + '%'], log=False)
+
+    _drop_local_pages(prefix)
+    notify('pages', prefix)
+
+    return success
@@ -0,0 +1,119 @@
+from .flex_templates import (
+    FlexTemplate, create_carousel, create_flex_message, create_text_message,
+    create_vertical_bubble
+)
+
+# LINE's limits, see https://developers.line.biz/en/reference/messaging-api/#flex-message
+max_messages = 5
+max_bubbles_per_carousel = 12
+max_bubble_bytes = 30000
+max_carousel_bytes = 50000
+max_alt_text_length = 400
+
+# sent in place of a bubble that is too big to be sent
+oversized_bubble = create_vertical_bubble([FlexTemplate({
+    "type": "text",
+    "text": "Isinya terlalu panjang untuk ditampilkan",
+    "wrap": True,
+    "size": "sm",
+    "color": "#444444"
+}).render()])
+
+
+def _size(item):
+    return len(item.encode('utf-8'))
+
+
+def split_rows(rows, header_count=1):
+    '''
+    pack the rows of a vertical bubble into as few bubbles as possible,
+    repeating the first `header_count` rows at the top of every bubble
+
+    returns: list of serialized bubbles
+    '''
+    header, body = rows[:header_count], rows[header_count:]
+    base_size = _size(create_vertical_bubble(header))
+
+    bubbles = []
+    current, current_size = list(header), base_size
+    for row in body:
+        row_size = _size(row) + 1
+        # start a new bubble, unless this one only has the header so far
+        if current_size + row_size > max_bubble_bytes and len(current) > len(header):
+            bubbles.append(create_vertical_bubble(current))
+            current, current_size = list(header), base_size
+        current.append(row)
+        current_size += row_size
+    bubbles.append(create_vertical_bubble(current))
+
+    return bubbles
+
+
+def _fit(bubble):
+    return oversized_bubble if _size(bubble) > max_bubble_bytes else bubble
+
+
+def pack_carousels(bubbles, max_bubbles=max_bubbles_per_carousel):
+    '''
+    split bubbles into carousels by count and size, keeping their order,
+    bubbles over the size limit are replaced by a notice
+
+    returns: list of lists of serialized bubbles
+    '''
+    # '{"type":"carousel","contents":[]}'
+    base_size = 33
+
+    carousels = []
+    current, current_size = [], base_size
+    for bubble in map(_fit, bubbles):
+        bubble_size = _size(bubble) + 1
+        if current and (len(current) == max_bubbles or current_size + bubble_size > max_carousel_bytes):
+            carousels.append(current)
+            current, current_size = [], base_size
+        current.append(bubble)
+        current_size += bubble_size
+    if current:
+        carousels.append(current)
+
+    return carousels
+
+
+def budget_flex(alt_text, bubbles, as_carousel=True, max_bubbles=max_bubbles_per_carousel):
+    '''
+    turn bubbles into as few flex messages as LINE accepts
+
+    bubbles over the size limit are replaced by a notice, and the rest are
+    split into carousels by pack_carousels. a single bubble is sent on its
+    own unless as_carousel is set.
+
+    returns: list of serialized messages
+    '''
+    alt_text = alt_text[:max_alt_text_length]
+
+    for bubble in bubbles:
+        if _size(bubble) > max_bubble_bytes:
+            print("Bubble of {} bytes replaced, the limit is {}".format(
+                _size(bubble), max_bubble_bytes))
+
+    if len(bubbles) == 1 and not as_carousel:
+        return [create_flex_message(alt_text, _fit(bubbles[0]))]
+
+    return [create_flex_message(alt_text, create_carousel(carousel))
+            for carousel in pack_carousels(bubbles, max_bubbles)]
+
+
+def budget_reply(messages):
+    '''
+    cut a reply down to the number of messages LINE accepts at once,
+    the last one that fits becomes a notice of how many were left out
+
+    returns: list of serialized messages
+    '''
+    if len(messages) <= max_messages:
+        return messages
+
+    left_out = len(messages) - max_messages + 1
+    print("Reply of {} messages cut to {}".format(len(messages), max_messages))
+
+    return messages[:max_messages - 1] + [create_text_message(
+        "{} pesan lainnya tidak bisa ditampilkan".format(left_out))]
@@ -0,0 +1,140 @@
+import os
+import json
+
+from .database_service import _run_query
+
+# an event claimed for longer than this (in seconds) is assumed to belong to a
+# crashed worker and is handed out again
+claim_timeout = int(os.environ.get('QUEUE_CLAIM_TIMEOUT', 300))
+max_attempts = int(os.environ.get('QUEUE_MAX_ATTEMPTS', 3))
+
+
+def _get_source_id(event):
+    '''
+    get the id of the chat an event came from (group, room, or user)
+    '''
+    source = event.get('source', {})
+    return source.get('groupId') or source.get('roomId') or source.get('userId')
+
+
+def split_events(body):
+    '''
+    split a webhook request body into queue rows
+
+    returns: list of (destination, source_id, payload)
+    '''
+    body_json = json.loads(body)
+    destination = body_json.get('destination')
+
+    return [(destination, _get_source_id(event), json.dumps(event))
+            for event in body_json.get('events', [])]
+
+
+def enqueue_events(body):
+    '''
+    split a webhook request body into its events and store them in the queue
+
+    parameters ->
+    body
+
+    body is the raw (already verified) webhook request body
+
+    returns: bool
+    '''
+    rows = split_events(body)
+
+    # LINE sends an empty list of events when verifying the webhook url
+    if not rows:
+        return True
+
+    query = "INSERT INTO webhook_events (destination, source_id, payload) VALUES " + \
+        ', '.join(['(%s, %s, %s)'] * len(rows))
+    parameters = [value for row in rows for value in row]
+
+    success, _ = _run_query(query, parameters, log=False)
+
+    return success
+
+
+def claim_events(limit=10):
+    '''
+    claim up to `limit` queued events, oldest first
+
+    FOR UPDATE SKIP LOCKED lets several workers claim at the same time
+    without ever handing out the same event twice. only the oldest event
+    of each chat that has not failed can be claimed, so a chat's next event
+    waits until the one before it is done, whichever worker has it.
+
+    returns: list of (id, source_id, destination, payload)
+    '''
+    # an event another worker is claiming still looks pending here, but it is
+    # locked and stays the oldest of its chat, so its chat is skipped either way
+    query = """
+    UPDATE webhook_events
+    SET status='processing', claimed_at=now(), attempts=attempts+1
+    WHERE id IN (
+        SELECT id FROM webhook_events AS queued
+        WHERE (status='pending'
+            OR (status='processing' AND attempts<%s
+                AND claimed_at < now() - %s * interval '1 second'))
+        AND (source_id IS NULL OR id = (
+            SELECT min(id) FROM webhook_events AS earlier
+            WHERE earlier.source_id = queued.source_id
+            AND earlier.status <> 'failed'
+            -- an abandoned claim that is out of attempts does not hold up its chat
+            AND NOT (earlier.status='processing' AND earlier.attempts>=%s
+                AND earlier.claimed_at < now() - %s * interval '1 second')
+        ))
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, source_id, destination, payload
+    """
+    parameters = [max_attempts, claim_timeout, max_attempts, claim_timeout, limit]
+
+    success, results = _run_query(query, parameters, log=False)
+
+    if success:
+        # RETURNING does not keep the order of the subquery
+        return sorted(results)
+    else:
+        return []
+
+
+def complete_event(event_id):
+    '''
+    remove a handled event from the queue
+    '''
+    query = "DELETE FROM webhook_events WHERE id=%s"
+    success, _ = _run_query(query, [event_id], log=False)
+
+    return success
+
+
+def fail_event(event_id):
+    '''
+    put a failed event back in the queue, or mark it as failed
+    once it has used up all of its attempts
+    '''
+    query = """
+    UPDATE webhook_events
+    SET status=CASE WHEN attempts>=%s THEN 'failed' ELSE 'pending' END
+    WHERE id=%s
+    """
+    success, _ = _run_query(query, [max_attempts, event_id], log=False)
+
+    return success
+
+
+def get_queue_depth():
+    '''
+    count the events waiting to be claimed
+    '''
+    query = "SELECT count(*) FROM webhook_events WHERE status='pending'"
+    success, results = _run_query(query, log=False)
+
+    if success:
+        return results[0][0]
+    else:
+        return None
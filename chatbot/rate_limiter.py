@@ -0,0 +1,23 @@
+import time
+import threading
+
+
+class RateLimiter:
+    '''
+    spaces calls to wait() at least 1/rate seconds apart,
+    across every thread sharing the limiter
+    '''
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+
+        if delay > 0:
+            time.sleep(delay)
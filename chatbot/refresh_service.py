@@ -0,0 +1,241 @@
+import os
+import time
+import operator
+import threading
+import functools
+
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from cachetools import LRUCache
+from cachetools.keys import hashkey
+
+# seconds between looking for entries to rebuild
+refresh_interval = float(os.environ.get('REFRESH_INTERVAL', 60))
+# entries are rebuilt once they are this far into their ttl
+refresh_ahead = float(os.environ.get('REFRESH_AHEAD', 0.8))
+# entries nobody asked for in this many seconds are left to expire
+refresh_idle = float(os.environ.get('REFRESH_IDLE', 86400))
+# days of api_calls counted to decide what is rebuilt first
+usage_days = int(os.environ.get('REFRESH_USAGE_DAYS', 7))
+
+# every cache made by refreshing_cache
+caches = []
+# called with (cache name, args) after an entry is rebuilt with another result
+_listeners = []
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('REFRESH_WORKERS', 2)), thread_name_prefix='refresh')
+_thread = None
+_thread_lock = threading.Lock()
+
+
+class _Entry:
+    __slots__ = ('value', 'fetched_at', 'used_at', 'args', 'kwargs')
+
+    def __init__(self, value, args, kwargs):
+        self.value = value
+        self.fetched_at = self.used_at = time.monotonic()
+        self.args = args
+        self.kwargs = kwargs
+
+
+class RefreshingCache:
+    '''
+    caches the results of `function` for `ttl` seconds, like ttl_cache,
+    but keeps serving an expired result while it is rebuilt in the background
+
+    only the first call for a set of arguments waits for `function`,
+    and a result is kept if rebuilding it fails. the refresher started by
+    start() rebuilds results before they expire, see refresh_due.
+
+    command is the api_calls name of the command the results are for, and
+    changed(old, new) tells whether a rebuilt result differs from the one it
+    replaces, by default when they are not equal
+    '''
+
+    def __init__(self, function, name, ttl, maxsize, command=None, changed=None):
+        self.function = function
+        self.name = name
+        self.ttl = ttl
+        self.command = command
+        self.changed = changed or operator.ne
+
+        self.entries = LRUCache(maxsize=maxsize)
+        self.refreshing = set()
+        # goes up whenever a result is added or changed
+        self.version = 0
+        self._lock = threading.Lock()
+        # held while an entry is built for the first time
+        self._miss_locks = {}
+
+        functools.update_wrapper(self, function)
+
+    def __call__(self, *args, **kwargs):
+        key = hashkey(*args, **kwargs)
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                miss_lock = self._miss_locks.setdefault(key, threading.Lock())
+
+        if entry is None:
+            # one caller builds it, the rest wait and get the same result
+            with miss_lock:
+                with self._lock:
+                    entry = self.entries.get(key)
+                if entry is None:
+                    try:
+                        entry = _Entry(self.function(*args, **kwargs), args, kwargs)
+                        with self._lock:
+                            self.entries[key] = entry
+                            self.version += 1
+                    finally:
+                        with self._lock:
+                            self._miss_locks.pop(key, None)
+                    return entry.value
+
+        entry.used_at = time.monotonic()
+        if entry.used_at - entry.fetched_at > self.ttl:
+            self.refresh(key)
+
+        return entry.value
+
+    def refresh(self, key):
+        '''
+        rebuild an entry in the background, unless it is already being rebuilt
+        '''
+        with self._lock:
+            if key in self.refreshing or key not in self.entries:
+                return
+            self.refreshing.add(key)
+            entry = self.entries[key]
+
+        _executor.submit(self._rebuild, key, entry)
+
+    def _rebuild(self, key, entry):
+        try:
+            value = self.function(*entry.args, **entry.kwargs)
+        except Exception as error:
+            print("Refreshing {}{} failed, keeping the old result: {}".format(
+                self.name, entry.args, error))
+            return
+        finally:
+            with self._lock:
+                self.refreshing.discard(key)
+
+        rebuilt = _Entry(value, entry.args, entry.kwargs)
+        rebuilt.used_at = entry.used_at
+        with self._lock:
+            self.entries[key] = rebuilt
+
+        # nothing built from the old result needs to change
+        if not self.changed(entry.value, value):
+            return
+
+        with self._lock:
+            self.version += 1
+
+        for listener in _listeners:
+            try:
+                listener(self.name, entry.args)
+            except Exception as error:
+                print("Refresh listener failed: {}".format(error))
+
+    def refresh_due(self):
+        '''
+        returns: list of (key, age) of entries that should be rebuilt,
+        which are in use and at least `refresh_ahead` into their ttl
+        '''
+        now = time.monotonic()
+        with self._lock:
+            return [(key, now - entry.fetched_at) for key, entry in self.entries.items()
+                    if now - entry.fetched_at > self.ttl * refresh_ahead
+                    and now - entry.used_at < refresh_idle
+                    and key not in self.refreshing]
+
+    def cached_results(self):
+        '''
+        returns: list of the results cached right now, without building any
+        '''
+        with self._lock:
+            return [entry.value for entry in self.entries.values()]
+
+    def cache_clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.version += 1
+
+
+def refreshing_cache(name, ttl, maxsize=4, command=None, changed=None):
+    '''
+    decorator, see RefreshingCache
+    '''
+    def decorator(function):
+        cache = RefreshingCache(function, name, ttl, maxsize, command, changed)
+        caches.append(cache)
+        return cache
+
+    return decorator
+
+
+def on_refresh(listener):
+    '''
+    call listener(cache name, args) whenever an entry was rebuilt
+    and its result changed
+    '''
+    _listeners.append(listener)
+
+
+def get_usage():
+    '''
+    returns: dict of command name -> times used in the last usage_days days
+    '''
+    # imported here, as database_service imports the modules using this one
+    from .database_service import _run_query
+
+    earliest_date = datetime.now() - timedelta(days=usage_days)
+    query = "SELECT api_call, count(api_call) FROM api_calls WHERE timestamp>=%s GROUP BY api_call"
+    success, results = _run_query(query, [earliest_date.strftime('%Y-%m-%d')], log=False)
+
+    return dict(results) if success else {}
+
+
+def refresh_all():
+    '''
+    rebuild every entry that is due, the most used commands first,
+    then the oldest entries
+
+    returns the number of entries queued to be rebuilt
+    '''
+    usage = get_usage()
+
+    due = [(usage.get(cache.command, 0), age, cache, key)
+           for cache in caches for key, age in cache.refresh_due()]
+    due.sort(key=lambda item: (-item[0], -item[1]))
+
+    for _, _, cache, key in due:
+        cache.refresh(key)
+
+    return len(due)
+
+
+def _run():
+    while True:
+        time.sleep(refresh_interval)
+        try:
+            refresh_all()
+        except Exception as error:
+            print("Refresher failed: {}".format(error))
+
+
+def start():
+    '''
+    start rebuilding cached results before they expire, once per process
+    '''
+    global _thread
+
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, name='refresher', daemon=True)
+            _thread.start()
@@ -0,0 +1,210 @@
+import json
+import threading
+
+from .command_payloads import static_command_types, build_command_payload
+from .command_resolver import CommandResolver
+from .database_service import _run_query, notify
+from .notify_service import subscribe, start_listener
+
+# the commands and codes tables only change when a functionary edits them,
+# so they are kept in memory and reloaded when a change is notified.
+# the dicts are replaced as a whole, never mutated, so readers don't need a lock
+_commands = None
+_codes = None
+_resolver = CommandResolver([])
+_load_lock = threading.Lock()
+
+
+def _create_command_entry(c_type, content, clearance, description, payload):
+    # image contents are parsed once here instead of on every dashboard view
+    source = content
+    if c_type in ('image', 'image carousel'):
+        try:
+            source = json.loads(content)
+        except ValueError:
+            source = None
+
+    # commands saved before their payload was built when saving
+    if payload is None and c_type in static_command_types:
+        try:
+            payload = build_command_payload(c_type, content, validate=False)
+        except (ValueError, TypeError, AttributeError) as e:
+            print("Command can't be built: {}".format(e))
+
+    return c_type, content, clearance, description, payload, source
+
+
+def load_commands(payload=None):
+    '''
+    (re)load every command into memory
+
+    name -> (type, content, clearance, description, payload, source)
+
+    payload is the serialized reply of static commands, and
+    source is the parsed content of image commands
+    '''
+    global _commands, _resolver
+
+    query = "SELECT name, type, content, clearance, description, payload FROM commands"
+    success, results = _run_query(query)
+
+    if success:
+        _commands = {row[0]: _create_command_entry(*row[1:]) for row in results}
+        _resolver = CommandResolver(_commands)
+
+
+def load_codes(payload=None):
+    '''
+    (re)load every code into memory
+
+    item -> code
+    '''
+    global _codes
+
+    query = "SELECT item, code FROM codes"
+    success, results = _run_query(query)
+
+    if success:
+        _codes = dict(results)
+
+
+def load():
+    '''
+    load both tables and keep them up to date with change notifications
+    '''
+    with _load_lock:
+        load_commands()
+        load_codes()
+        start_listener()
+
+
+def _ensure_loaded():
+    if _commands is None or _codes is None:
+        load()
+
+
+subscribe('commands', load_commands)
+subscribe('codes', load_codes)
+
+
+def resolve_command(text):
+    '''
+    resolve what was typed after the '?' into a command name
+
+    returns (command name, suggestion), see CommandResolver.resolve
+    '''
+    _ensure_loaded()
+
+    return _resolver.resolve(text)
+
+
+def get_command(command_name):
+    '''
+    get a command's type, content, and clearance based on the command name
+
+    returns (type, content, clearance), or None if the command does not exist
+    '''
+    _ensure_loaded()
+
+    command = (_commands or {}).get(command_name)
+    if command:
+        return command[:3]
+    else:
+        return None
+
+
+def get_command_payload(command_name):
+    '''
+    get the serialized reply of a static (text, image, image carousel) command
+
+    returns the payload, or None if the command has none
+    '''
+    _ensure_loaded()
+
+    command = (_commands or {}).get(command_name)
+    if command:
+        return command[4]
+    else:
+        return None
+
+
+def get_static_commands():
+    '''
+    get every text, image, and image carousel command for the dashboard
+
+    returns a list of (name, source, description, type, clearance),
+    source is the parsed content of image commands
+    '''
+    _ensure_loaded()
+
+    return [(name, source, description, c_type, clearance)
+            for name, (c_type, _, clearance, description, _, source) in (_commands or {}).items()
+            if c_type in static_command_types]
+
+
+def commands_changed(command_name):
+    '''
+    reload the commands after the dashboard changed one,
+    here right away and in every other process through notify
+    '''
+    load_commands()
+    notify('commands', command_name)
+
+
+def get_command_description(command_name):
+    '''
+    get a command's description based on the command name
+
+    returns (description)
+    '''
+    _ensure_loaded()
+
+    command = (_commands or {}).get(command_name)
+    if command:
+        return command[3]
+    else:
+        return "-"
+
+
+def get_code(item: str) -> str:
+    '''
+    returns a code based on the item name
+    '''
+    _ensure_loaded()
+
+    code = (_codes or {}).get(item)
+    if code is not None:
+        return code
+    else:
+        return "Gagal, coba lagi"
+
+
+def update_code(item, code):
+    '''
+    update a code
+
+    currently there are only these items:
+
+    - ruang_alat
+    - loker_doksos
+    - lemari_oren
+    - eneng
+    - cici
+
+    '''
+    global _codes
+
+    query = "UPDATE codes SET code=%s WHERE item=%s"
+    parameters = [code, item]
+    success, _ = _run_query(query, parameters)
+
+    if success:
+        _ensure_loaded()
+        if _codes is not None:
+            _codes = {**_codes, item: code}
+        else:
+            # loading failed before, read them again with the new code in
+            load_codes()
+        notify('codes', item)
+
+    return success
@@ -0,0 +1,89 @@
+import json
+import hashlib
+
+from datetime import datetime
+
+from .utils import calendar_timezone as timezone
+from .database_service import _run_query
+from .titles import normalize_title
+
+
+def _today():
+    return timezone.localize(datetime.now()).date()
+
+
+def _digest(serialized):
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def get_last_snapshot(cinema_name):
+    '''
+    get the last movies scraped from a cinema
+
+    returns: (day, digest, list of (title, showing hours)), or None
+    '''
+    query = "SELECT day, digest, movies FROM showtime_snapshots WHERE cinema=%s ORDER BY day DESC LIMIT 1"
+    success, results = _run_query(query, [cinema_name], log=False)
+
+    if success and results:
+        day, digest, movies = results[0]
+        return day, digest, [(title, schedule) for title, schedule in json.loads(movies)]
+    else:
+        return None
+
+
+def save_snapshot(cinema_name, movies):
+    '''
+    save the movies scraped from a cinema as today's snapshot of it
+
+    parameters ->
+    cinema_name,
+    movies
+
+    movies is a list of (title, showing hours)
+
+    returns: the snapshot it replaces as in get_last_snapshot, or None
+    '''
+    previous = get_last_snapshot(cinema_name)
+
+    serialized = json.dumps(movies)
+    digest = _digest(serialized)
+
+    # nothing to write when today's snapshot didn't change
+    if previous and previous[0] == _today() and previous[1] == digest:
+        return previous
+
+    query = "INSERT INTO showtime_snapshots (cinema, day, movies, digest) VALUES (%s, %s, %s, %s) " + \
+        "ON CONFLICT (cinema, day) DO UPDATE SET movies=EXCLUDED.movies, digest=EXCLUDED.digest, scraped_at=now()"
+    _run_query(query, [cinema_name, _today(), serialized, digest], log=False)
+
+    return previous
+
+
+def get_today_snapshot(cinema_name):
+    '''
+    returns: today's list of (title, showing hours) of a cinema, or None
+    '''
+    snapshot = get_last_snapshot(cinema_name)
+
+    if snapshot and snapshot[0] == _today():
+        return snapshot[2]
+    else:
+        return None
+
+
+def diff_movies(old, new):
+    '''
+    compare two lists of (title, showing hours) of a cinema, by normalized title
+
+    returns: (added titles, removed titles, titles with other showing hours)
+    '''
+    old_index = {normalize_title(title): (title, schedule) for title, schedule in old}
+    new_index = {normalize_title(title): (title, schedule) for title, schedule in new}
+
+    added = [new_index[key][0] for key in new_index.keys() - old_index.keys()]
+    removed = [old_index[key][0] for key in old_index.keys() - new_index.keys()]
+    changed = [new_index[key][0] for key in new_index.keys() & old_index.keys()
+               if sorted(new_index[key][1]) != sorted(old_index[key][1])]
+
+    return sorted(added), sorted(removed), sorted(changed)
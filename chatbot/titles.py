@@ -0,0 +1,58 @@
+import os
+import re
+import unicodedata
+
+# screening formats and languages cinemas add to a title, e.g. "DUNE (IMAX 2D)"
+format_tag_pattern = re.compile(
+    r'\s*[\(\[](?:\s*(?:2D|3D|4DX|IMAX|ATMOS|DOLBY|SCREENX|SPHEREX|STARIUM|VELVET|'
+    r'SWEETBOX|GOLD CLASS|PREMIERE|SUB\w*|DUB\w*|INDO\w*|ENGLISH|KOREAN|JAPANESE)\s*)+[\)\]]',
+    re.IGNORECASE)
+punctuation_pattern = re.compile(r"[^\w\s]|_")
+whitespace_pattern = re.compile(r'\s+')
+
+
+def fold_case(title):
+    return title.casefold()
+
+
+def strip_accents(title):
+    return ''.join(character for character in unicodedata.normalize('NFKD', title)
+                   if not unicodedata.combining(character))
+
+
+def strip_format_tags(title):
+    return format_tag_pattern.sub(' ', title)
+
+
+def strip_punctuation(title):
+    # "SPIDER-MAN: NO WAY HOME" and "SPIDERMAN NO WAY HOME" end up the same
+    return punctuation_pattern.sub('', title.replace('&', ' and '))
+
+
+def collapse_whitespace(title):
+    return whitespace_pattern.sub(' ', title).strip()
+
+
+# name -> step, for TITLE_NORMALIZATION
+normalization_steps = {
+    'case': fold_case,
+    'accents': strip_accents,
+    'format_tags': strip_format_tags,
+    'punctuation': strip_punctuation,
+    'whitespace': collapse_whitespace,
+}
+
+# the steps normalize_title takes, in order, e.g. "case,format_tags,whitespace"
+pipeline = [normalization_steps[name.strip()] for name in os.environ.get(
+    'TITLE_NORMALIZATION', 'case,accents,format_tags,punctuation,whitespace').split(',')]
+
+
+def normalize_title(title, pipeline=pipeline):
+    '''
+    reduce a movie title to the form it is matched by,
+    so cinemas listing the same movie differently agree on it
+    '''
+    for step in pipeline:
+        title = step(title)
+
+    return title
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .http_cache import cached_get
+from .rate_limiter import RateLimiter
+from .refresh_service import refreshing_cache
+
+movie_api_key = os.environ.get('MOVIE_API_KEY')
+
+discover_url = "https://api.themoviedb.org/3/discover/movie"
+
+# pages of a week fetched at the same time, and requests per second across all of them
+concurrency = int(os.environ.get('TMDB_CONCURRENCY', 4))
+rate = float(os.environ.get('TMDB_RATE', 20))
+# 20 movies a page
+max_pages = int(os.environ.get('TMDB_MAX_PAGES', 5))
+timeout = float(os.environ.get('TMDB_TIMEOUT', 10))
+max_retries = 3
+
+session = requests.Session()
+session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+limiter = RateLimiter(rate)
+_executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='tmdb')
+# weeks wait for their pages on _executor, so they are fetched on a pool of their own
+_week_executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='tmdb-week')
+
+
+def get_discover_page(region, start_date, end_date, page=1):
+    '''
+    get one page of movies released between start_date and end_date,
+    waiting out TMDb's rate limit when it is hit
+
+    returns: the decoded response, with results and total_pages
+    '''
+    params = {
+        'api_key': movie_api_key,
+        'sort_by': 'release_date.asc',
+        'release_date.gte': start_date.isoformat(),
+        'release_date.lte': end_date.isoformat(),
+        'region': region,
+        'page': page,
+    }
+
+    for attempt in range(max_retries + 1):
+        limiter.wait()
+        try:
+            return json.loads(cached_get(session, discover_url, params=params, timeout=timeout))
+        except requests.exceptions.HTTPError as error:
+            if error.response.status_code != 429 or attempt == max_retries:
+                raise
+            delay = float(error.response.headers.get('Retry-After', 1))
+            print("TMDb rate limit hit, retrying in {}s".format(delay))
+            time.sleep(min(delay, 10))
+
+
+def week_start(day):
+    '''
+    the monday of the week `day` is in
+    '''
+    return day - timedelta(days=day.weekday())
+
+
+@refreshing_cache('tmdb_week', ttl=21600, maxsize=64, command='upcomingmovies')
+def get_week(region, monday):
+    '''
+    get every movie released in `region` in the week starting on monday,
+    up to max_pages pages of them
+
+    the first page says how many there are, the rest are fetched at the same time
+    '''
+    sunday = monday + timedelta(days=6)
+    first_page = get_discover_page(region, monday, sunday)
+
+    pages = range(2, min(first_page.get('total_pages', 1), max_pages) + 1)
+    other_pages = _executor.map(
+        lambda page: get_discover_page(region, monday, sunday, page), pages)
+
+    movies = list(first_page['results'])
+    for page in other_pages:
+        movies += page['results']
+
+    return tuple(movies)
+
+
+def discover_movies(start_date=None, end_date=None, region='ID'):
+    '''
+    get the movies released in `region` between start_date and end_date,
+    which are 'YYYY-MM-DD' strings, sorted by release date
+
+    the window is sliced from the cached weeks it covers, so overlapping
+    windows share their requests. the weeks are fetched at the same time,
+    and it is the next 30 days by default.
+    '''
+    start = date.fromisoformat(start_date) if start_date else date.today()
+    end = date.fromisoformat(end_date) if end_date else start + timedelta(days=30)
+    start_date, end_date = start.isoformat(), end.isoformat()
+
+    mondays = []
+    monday = week_start(start)
+    while monday <= end:
+        mondays.append(monday)
+        monday += timedelta(days=7)
+
+    movies = {}
+    for week in _week_executor.map(lambda monday: get_week(region, monday), mondays):
+        for movie in week:
+            if start_date <= movie.get('release_date', '') <= end_date:
+                movies[movie['id']] = movie
+
+    return sorted(movies.values(), key=lambda movie: movie['release_date'])
@@ -0,0 +1,128 @@
+import os
+import atexit
+import threading
+
+from collections import deque
+from datetime import datetime
+
+from .utils import calendar_timezone as timezone
+from .database_service import _run_query
+
+batch_size = int(os.environ.get('USAGE_BATCH_SIZE', 50))
+flush_interval = float(os.environ.get('USAGE_FLUSH_INTERVAL', 10))
+# rows kept while the database is unreachable, the oldest are dropped beyond this
+max_buffer = int(os.environ.get('USAGE_MAX_BUFFER', 10000))
+
+
+class UsageWriter:
+    '''
+    collects api_calls rows and inserts them in bulk from a background thread
+
+    rows are flushed once `batch_size` of them are waiting or every
+    `flush_interval` seconds, whichever comes first. rows that can't be
+    written are retried with the next flush until the buffer overflows.
+    '''
+
+    def __init__(self, batch_size=batch_size, flush_interval=flush_interval, max_buffer=max_buffer):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows = deque(maxlen=max_buffer)
+        self.dropped = 0
+        self.written = 0
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add(self, row):
+        with self._lock:
+            if len(self.rows) == self.rows.maxlen:
+                self.dropped += 1
+            self.rows.append(row)
+            size = len(self.rows)
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='usage-writer', daemon=True)
+                self._thread.start()
+
+        if size >= self.batch_size:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as error:
+                # rows added later still need this thread to write them
+                print("Usage writer failed: {}".format(error))
+
+    def flush(self):
+        '''
+        write every buffered row with a single multi-row insert
+
+        returns: bool
+        '''
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self.rows)
+                self.rows.clear()
+
+            if not rows:
+                return True
+
+            query = "INSERT INTO api_calls (timestamp, user_id, api_call) VALUES " + \
+                ', '.join(['(%s, %s, %s)'] * len(rows))
+            parameters = [value for row in rows for value in row]
+
+            try:
+                success, _ = _run_query(query, parameters, log=False)
+            except Exception as error:
+                print("Usage rows not written: {}".format(error))
+                success = False
+
+            with self._lock:
+                if success:
+                    self.written += len(rows)
+                else:
+                    # put them back in front of anything added meanwhile,
+                    # keeping only the newest rows if the buffer overflows
+                    rows += self.rows
+                    self.dropped += max(len(rows) - self.rows.maxlen, 0)
+                    self.rows = deque(rows, maxlen=self.rows.maxlen)
+                    print("Usage rows not written, {} buffered, {} dropped so far".format(
+                        len(self.rows), self.dropped))
+
+            return success
+
+    def stop(self):
+        '''
+        stop the background thread and flush what is left
+        '''
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        if not self.flush():
+            self.dropped += len(self.rows)
+            self.rows.clear()
+        if self.dropped:
+            print("Usage writer stopped, {} rows were dropped".format(self.dropped))
+
+
+usage_writer = UsageWriter()
+atexit.register(usage_writer.stop)
+
+
+def track_api_calls(api_call, user_id):
+    '''
+    record a command usage, written to api_calls in the background
+    '''
+    now = timezone.localize(datetime.now())
+    usage_writer.add((now, user_id, api_call))
+
+    return True
@@ -1,9 +1,19 @@
+import os
+
 from datetime import datetime, timedelta
 
 import pytz
 
 timezone = pytz.timezone("Asia/Jakarta")
 
+# the timezone of the calendars and of the dates saved in the database,
+# kept here so modules that need it don't import calendar_service
+if os.environ.get('CALENDAR_ENDPOINT'):
+    calendar_timezone = pytz.timezone("UTC")  # set as UTC as heroku runs on UTC
+else:
+    # set as Asia/Jakarta on local machine
+    calendar_timezone = pytz.timezone("Asia/Jakarta")
+
 def compose_help_message(commands, authenticated):
     '''
     Compose the help message
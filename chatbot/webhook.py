@@ -0,0 +1,39 @@
+import os
+
+from flask import Blueprint, request, abort
+
+from linebot.webhook import SignatureValidator
+
+from .queue_service import enqueue_events
+
+channel_secret = os.environ.get('CHANNEL_SECRET')
+
+signature_validator = SignatureValidator(channel_secret)
+
+# webhook role, see app.create_app.
+# only queues events, the handlers in chatbot.bot run in worker.py
+blueprint = Blueprint('webhook', __name__)
+
+
+def callback():
+    # get X-Line-Signature header value
+    signature = request.headers['X-Line-Signature']
+
+    # get request body as text
+    body = request.get_data(as_text=True)
+    print(body)
+    # app.logger.info("Request body: " + body)
+
+    if not signature_validator.validate(body, signature):
+        print("Invalid signature. Please check your channel access token/channel secret.")
+        abort(400)
+
+    # the events are handled later by worker.py, so LINE gets its reply
+    # without waiting for the commands to run
+    if not enqueue_events(body):
+        abort(500)
+
+    return 'OK'
+
+
+blueprint.add_url_rule('/callback', view_func=callback, methods=['POST'])
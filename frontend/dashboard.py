@@ -1,22 +1,17 @@
-import os
 import json
 
 from collections import Counter
 from datetime import datetime, timedelta
 from dateutil import parser
 
-import psycopg2
 import pytz
 
 from flask import render_template, redirect, request, abort, session, escape
 
-from chatbot.database_service import _run_query
-from chatbot.calendar_service import timezone
-from chatbot.bot import line_bot_api
-
-DATABASE_URL = os.environ.get('DATABASE_URL')
-
-conn = psycopg2.connect(DATABASE_URL)
+from chatbot.command_payloads import build_command_payload
+from chatbot.database_service import _run_query, invalidate_clearance
+from chatbot.registry_service import commands_changed, get_static_commands
+from chatbot.utils import calendar_timezone as timezone
 
 
 def check_login():
@@ -101,12 +96,19 @@ def update_command(command_name):
         elif command_type == 'text':
             command_content = request.form['content']
 
-        query = "UPDATE commands SET type=%s, description=%s, clearance=%s, content=%s WHERE name=%s"
+        # the reply is built and checked once here, the bot only sends it
+        try:
+            command_payload = build_command_payload(command_type, command_content)
+        except ValueError as e:
+            return abort(400, str(e))
+
+        query = "UPDATE commands SET type=%s, description=%s, clearance=%s, content=%s, payload=%s WHERE name=%s"
         parameters = [command_type, command_description,
-                      command_clearance, command_content, command_name]
+                      command_clearance, command_content, command_payload, command_name]
 
-        success, _ = _run_query(conn, query, parameters)
+        success, _ = _run_query(query, parameters)
         if success:
+            commands_changed(command_name)
             return redirect("/commands")
         else:
             abort(500)
@@ -117,7 +119,7 @@ def edit_command(command_name):
     if check_login():
         query = "SELECT * FROM commands WHERE name=%s"
 
-        success, results = _run_query(conn, query, [command_name])
+        success, results = _run_query(query, [command_name])
 
         if success:
             result = results[0]
@@ -141,9 +143,10 @@ def delete_command(command_name):
 
         query = "DELETE FROM commands WHERE name=%s"
 
-        success, _ = _run_query(conn, query, [command_name])
+        success, _ = _run_query(query, [command_name])
 
         if success:
+            commands_changed(command_name)
             return redirect("/commands")
         else:
             return abort(500)
@@ -180,13 +183,20 @@ def create_new_command():
         elif command_type == 'text':
             command_content = request.form['content']
 
-        query = "INSERT INTO commands (type, name, description, clearance, content) VALUES (%s, %s, %s, %s, %s)"
+        # the reply is built and checked once here, the bot only sends it
+        try:
+            command_payload = build_command_payload(command_type, command_content)
+        except ValueError as e:
+            return abort(400, str(e))
+
+        query = "INSERT INTO commands (type, name, description, clearance, content, payload) VALUES (%s, %s, %s, %s, %s, %s)"
         parameters = [command_type, command_name,
-                      command_description, command_clearance, command_content]
+                      command_description, command_clearance, command_content, command_payload]
 
-        success, _ = _run_query(conn, query, parameters)
+        success, _ = _run_query(query, parameters)
 
         if success:
+            commands_changed(command_name)
             return redirect("/commands")
         else:
             return abort(500)
@@ -204,7 +214,7 @@ def get_all_api_calls():
 
         return tuple(lst)
 
-    success, results = _run_query(conn, query)
+    success, results = _run_query(query)
     results.reverse()
 
     if success:
@@ -247,40 +257,33 @@ def get_api_calls_counter(data):
 
 
 def get_all_commands():
-    query = "SELECT * FROM commands WHERE type='text' OR type='image' OR type='image carousel'"
-
+    # served from the registry, where image contents are already parsed
     return_data = []
-    success, results = _run_query(conn, query)
-
-    if success:
-        for result in results:
-            if result[3] == 'image' or result[3] == 'image carousel':
-                image_data = json.loads(result[1])
-                return_data.append(
-                    (escape(result[0]), image_data['url'], escape(result[2]), result[3], result[4]))
-            elif result[3] == 'text':
-                return_data.append(
-                    (escape(result[0]), escape(result[1]), escape(result[2]), result[3], result[4]))
-        return return_data
 
-    else:
-        return abort(500)
+    for name, source, description, c_type, clearance in get_static_commands():
+        if c_type == 'image' or c_type == 'image carousel':
+            return_data.append(
+                (escape(name), (source or {}).get('url'), escape(description), c_type, clearance))
+        elif c_type == 'text':
+            return_data.append(
+                (escape(name), escape(source), escape(description), c_type, clearance))
+    return return_data
 
 
 def get_all_users():
     query = "SELECT display_name, user_type, picture_url FROM followers"
 
-    success, results = _run_query(conn, query)
+    success, results = _run_query(query)
 
     if success:
         return results
 
 
 def toggle_user_clearance(display_name):
-    query = "SELECT user_type FROM followers WHERE display_name=%s"
+    query = "SELECT user_type, user_id FROM followers WHERE display_name=%s"
     parameters = [display_name]
 
-    success, results = _run_query(conn, query, parameters)
+    success, results = _run_query(query, parameters)
 
     if success:
         result = results[0]
@@ -288,8 +291,11 @@ def toggle_user_clearance(display_name):
             query = "UPDATE followers SET user_type=2 WHERE display_name=%s"
         elif result[0] == 2:
             query = "UPDATE followers SET user_type=1 WHERE display_name=%s"
-        success, _ = _run_query(conn, query, parameters)
+        success, _ = _run_query(query, parameters)
         if success:
+            # display names are not unique, drop every user that was updated
+            for _, user_id in results:
+                invalidate_clearance('user', user_id)
             return "True"
         else:
             return "False"
@@ -308,7 +314,7 @@ def render_groups():
 def get_all_groups():
     query = "SELECT group_id, group_name, group_type FROM groups"
 
-    success, results = _run_query(conn, query)
+    success, results = _run_query(query)
 
     if success:
         return results
@@ -321,9 +327,10 @@ def change_group_clearance(group_id):
 
         query = "UPDATE groups SET group_type=%s WHERE group_id=%s"
 
-        success, _ = _run_query(conn, query, parameters)
+        success, _ = _run_query(query, parameters)
 
         if success:
+            invalidate_clearance('group', group_id)
             return "True"
         else:
             return "False"
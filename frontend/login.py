@@ -5,11 +5,9 @@ from urllib.parse import urlencode
 
 import requests
 import jwt
-import psycopg2
 from flask import redirect, request, abort, session
 
-DATABASE_URL = os.environ.get('DATABASE_URL')
-conn = psycopg2.connect(DATABASE_URL)
+from chatbot.database_service import get_clearance
 
 CHANNEL_ID = os.environ.get('CHANNEL_LOGIN_ID')
 CHANNEL_SECRET = os.environ.get('CHANNEL_LOGIN_SECRET')
@@ -74,21 +72,10 @@ def login_callback():
 
 
 def front_authenticate(profile, num):
-    cursor = conn.cursor()
-    parameters = [profile['user_id']]
-    query = "SELECT * FROM followers WHERE user_id=%s"
-    try:
-        cursor = conn.cursor()
-        cursor.execute(query, parameters)
-        result = cursor.fetchone()
-        cursor.close()
-
-        # check if result exists. if it doesn't that means the user is not registered yet.
-        if result:
-            # check user/group type
-            return bool(result[2] >= num)
-        return False
-
-    except (Exception, psycopg2.Error) as e:
-        print("Error in update operation", e)
-        print("Error: ", query)
+    clearance = get_clearance('user', profile['user_id'])
+
+    # check if clearance exists. if it doesn't that means the user is not registered yet.
+    if clearance is not None:
+        # check user/group type
+        return bool(clearance >= num)
+    return False
@@ -0,0 +1,40 @@
+from flask import Blueprint
+
+from frontend import dashboard
+from frontend import login
+
+# dashboard role, see app.create_app
+blueprint = Blueprint('dashboard', __name__)
+
+blueprint.add_url_rule('/', view_func=dashboard.render)
+
+# auth
+blueprint.add_url_rule('/login', view_func=login.redirect_login)
+blueprint.add_url_rule('/login/callback', view_func=login.login_callback)
+
+# users
+blueprint.add_url_rule('/users', view_func=dashboard.render_users, methods=['GET'])
+blueprint.add_url_rule('/users/<display_name>',
+                       view_func=dashboard.toggle_clearance, methods=['POST'])
+
+# groups
+blueprint.add_url_rule('/groups', view_func=dashboard.render_groups, methods=['GET'])
+blueprint.add_url_rule('/groups/<group_id>',
+                       view_func=dashboard.change_group_clearance, methods=['POST'])
+
+# commands
+blueprint.add_url_rule(
+    '/commands', view_func=dashboard.commands_render, methods=['GET'])
+blueprint.add_url_rule(
+    '/commands', view_func=dashboard.create_new_command, methods=['POST'])
+blueprint.add_url_rule(
+    '/commands/new', view_func=dashboard.render_add_new, methods=['GET'])
+blueprint.add_url_rule('/commands/<command_name>',
+                       view_func=dashboard.edit_command, methods=['GET'])
+blueprint.add_url_rule('/commands/<command_name>',
+                       view_func=dashboard.update_command, methods=['POST'])
+
+# do change this one later! ---
+blueprint.add_url_rule('/commands/delete/<command_name>',
+                       view_func=dashboard.delete_command)
+# -----
@@ -0,0 +1,14 @@
+-- queue of webhook events waiting to be handled by worker.py
+CREATE TABLE IF NOT EXISTS webhook_events (
+    id BIGSERIAL PRIMARY KEY,
+    destination TEXT,
+    source_id TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    received_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    claimed_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS webhook_events_pending_idx
+    ON webhook_events (id) WHERE status <> 'failed';
@@ -0,0 +1,3 @@
+-- serialized reply of static commands, built by the dashboard when saving,
+-- see chatbot/command_payloads.py
+ALTER TABLE commands ADD COLUMN IF NOT EXISTS payload TEXT;
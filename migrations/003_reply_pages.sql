@@ -0,0 +1,10 @@
+-- pre-rendered pages of long replies, served by "next page" postbacks,
+-- see chatbot/pagination.py
+CREATE TABLE IF NOT EXISTS reply_pages (
+    query_key TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    clearance INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (query_key, page)
+);
@@ -0,0 +1,10 @@
+-- the showtimes scraped from every cinema, the last scrape of each day,
+-- see chatbot/showtime_snapshots.py
+CREATE TABLE IF NOT EXISTS showtime_snapshots (
+    cinema TEXT NOT NULL,
+    day DATE NOT NULL,
+    movies TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    scraped_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (cinema, day)
+);
@@ -0,0 +1,4 @@
+-- ?Film <title>, handled in chatbot/bot.py like the other 'others' commands
+INSERT INTO commands (type, name, description, clearance, content)
+SELECT 'others', 'film', 'Cari jadwal tayang sebuah film, contoh: ?Film Dune', 1, ''
+WHERE NOT EXISTS (SELECT 1 FROM commands WHERE name = 'film');
@@ -0,0 +1,3 @@
+-- finds the oldest event of a chat, see claim_events in chatbot/queue_service.py
+CREATE INDEX IF NOT EXISTS webhook_events_source_idx
+    ON webhook_events (source_id, id) WHERE status <> 'failed';
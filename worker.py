@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import time
+import signal
+
+from chatbot.bot import dispatch_event
+from chatbot.dispatcher import EventDispatcher
+from chatbot.http_cache import get_http_cache_stats
+from chatbot.line_http_client import get_line_api_stats
+from chatbot import refresh_service, registry_service
+from chatbot.database_service import get_clearance_cache_stats
+from chatbot.queue_service import (
+    claim_events, complete_event, fail_event, get_queue_depth
+)
+
+batch_size = int(os.environ.get('QUEUE_BATCH_SIZE', 10))
+poll_interval = float(os.environ.get('QUEUE_POLL_INTERVAL', 0.5))
+report_interval = float(os.environ.get('QUEUE_REPORT_INTERVAL', 60))
+
+dispatcher = EventDispatcher(dispatch_event)
+
+
+def process_batch(stats):
+    '''
+    claim a batch of events and run them through the webhook handlers
+
+    returns the number of events claimed
+    '''
+    claimed = claim_events(batch_size)
+
+    events = [(event_id, source_id, destination, json.loads(payload))
+              for event_id, source_id, destination, payload in claimed]
+
+    for event_id, error, latency in dispatcher.run(events):
+        stats['latencies'].append(latency)
+        if error:
+            print("Event {} failed: {}".format(event_id, error))
+            fail_event(event_id)
+            stats['failed'] += 1
+        else:
+            complete_event(event_id)
+            stats['processed'] += 1
+
+    return len(claimed)
+
+
+def new_stats():
+    return {'processed': 0, 'failed': 0, 'latencies': []}
+
+
+def report(stats, elapsed):
+    throughput = (stats['processed'] + stats['failed']) / elapsed
+    latencies = stats['latencies']
+    mean_latency = sum(latencies) / len(latencies) if latencies else 0
+    max_latency = max(latencies) if latencies else 0
+    print("Worker: {} processed, {} failed, {:.2f} events/s, queue depth: {}, pool size: {}, "
+          "event latency: {:.0f} ms mean / {:.0f} ms max".format(
+              stats['processed'], stats['failed'], throughput, get_queue_depth(),
+              dispatcher.max_workers, mean_latency * 1000, max_latency * 1000))
+    print("Clearance cache: {hits} hits, {misses} misses, {hit_rate:.0%} hit rate, {size} entries".format(
+        **get_clearance_cache_stats()))
+    # counted since the worker started
+    print("HTTP cache: {hits} hits, {revalidations} revalidated, {misses} misses".format(
+        **get_http_cache_stats()))
+    for endpoint, api_stats in sorted(get_line_api_stats().items()):
+        print("LINE {}: {calls} calls, {errors} errors, {retries} retried, "
+              "{mean_latency:.3f}s mean / {max_latency:.3f}s max".format(endpoint, **api_stats))
+
+
+def run():
+    # load commands and codes before the first event arrives
+    registry_service.load()
+    # rebuild cached movies and agendas before they expire
+    refresh_service.start()
+
+    stats = new_stats()
+    last_report = time.monotonic()
+
+    while True:
+        try:
+            claimed = process_batch(stats)
+
+            now = time.monotonic()
+            if now - last_report >= report_interval:
+                report(stats, now - last_report)
+                stats = new_stats()
+                last_report = now
+        except Exception as error:
+            # e.g. the database is down, claimed events are handed out again later
+            print("Worker poll failed: {}".format(error))
+            claimed = 0
+
+        # only wait when the queue is drained, reply tokens expire quickly
+        if not claimed:
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    # exit normally on SIGTERM so buffered usage rows are flushed by atexit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    run()